@@ -0,0 +1,267 @@
+"""Benchmark suite for pareto_mapper and symmetric_pareto_mapper.
+
+Measures time, nodes searched, peak memory and frontier size across n, |Y|
+and epsilon on the bundled example datasets and on synthetic joints, and
+the frontier quality of beam searches against the epsilon search, and
+writes the results as JSON. Run from this directory, e.g.
+
+    python benchmark.py --suite quick --output quick.json
+    python benchmark.py --suite quick --compare quick.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+from time import perf_counter
+
+import numpy as np
+
+import pareto_dib
+from pareto_dib import pareto_mapper, symmetric_pareto_mapper
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "..", "examples", "data")
+
+# Datasets
+
+
+def bundled(name):
+    return np.load(os.path.join(DATA_DIR, f"pxy_{name}.npy"))
+
+
+def random_joint(n, ny, density=1., seed=0):
+    """random p_{XY} with a fraction density of nonzero entries"""
+    rng = np.random.default_rng(seed)
+    p = rng.random((n, ny)) * (rng.random((n, ny)) < density)
+    p[np.arange(n), rng.integers(ny, size=n)] += rng.random(n)
+
+    return p / p.sum()
+
+
+def cyclic_joint(n, noise=0., seed=0):
+    """p_{X1 X2; Y} of Y = X1 + X2 mod n with uniform X1, X2, mixed with
+    uniform noise"""
+    p = np.zeros((n, n, n))
+    for x1 in range(n):
+        for x2 in range(n):
+            p[x1, x2, (x1 + x2) % n] = 1.
+
+    if noise > 0:
+        rng = np.random.default_rng(seed)
+        q = rng.random((n, n, n))
+        p = (1 - noise) * p / p.sum() + noise * (q + q.transpose(1, 0, 2))
+
+    return p / p.sum()
+
+
+# cases are (name, mapper, joint, parameters of the series)
+
+def suite(name):
+    cases = []
+
+    def add(series, mapper, make, **params):
+        cases.append({'series': series, 'mapper': mapper, 'make': make,
+                      'params': params})
+
+    if name == 'quick':
+        ns, nys, epsilons, group_ns = [6, 8, 10, 12], [8, 32], [1e-8], \
+            [4, 6, 8, 10]
+        datasets, beam_widths = ['Z40x', 'pauli', 'alpha27'], [4, 16]
+    else:
+        ns, nys, epsilons, group_ns = [8, 12, 16, 20, 24], [8, 64, 512], \
+            [1e-8, 1e-4, 1e-2], [4, 6, 8, 10, 12, 14]
+        datasets = ['Z40x', 'pauli', 'alpha27', 'colors']
+        beam_widths = [1, 4, 16, 64, 256]
+
+    for dset in datasets:
+        mapper = 'symmetric' if dset in ('Z40x', 'pauli') else 'standard'
+        for epsilon in epsilons:
+            add("bundled", mapper, lambda d=dset: bundled(d), dataset=dset,
+                epsilon=epsilon)
+        for beam_width in beam_widths:
+            add("beam", mapper, lambda d=dset: bundled(d), dataset=dset,
+                epsilon=None, beam_width=beam_width)
+
+    for ny in nys:
+        for n in ns:
+            for epsilon in epsilons:
+                add(f"random_y{ny}", 'standard',
+                    lambda n=n, ny=ny: random_joint(n, ny, density=0.5),
+                    n=n, ny=ny, epsilon=epsilon)
+
+    for n in group_ns:
+        for epsilon in epsilons:
+            add("cyclic", 'symmetric', lambda n=n: cyclic_joint(n),
+                n=n, ny=n, epsilon=epsilon)
+            add("cyclic_noisy", 'symmetric',
+                lambda n=n: cyclic_joint(n, noise=0.01),
+                n=n, ny=n, epsilon=epsilon)
+
+    return cases
+
+
+# Measurements
+
+def run(case, repeat=1, memory=True):
+    mapper = pareto_mapper if case['mapper'] == 'standard' \
+        else symmetric_pareto_mapper
+    p = case['make']()
+    kwargs = {'epsilon': case['params']['epsilon'] or 1e-8, 'seed': 0,
+              'beam_width': case['params'].get('beam_width')}
+
+    times = []
+    for _ in range(repeat):
+        t0 = perf_counter()
+        pset, run_stats = mapper(p, **kwargs)
+        times.append(perf_counter() - t0)
+
+    # area dominated by the frontier above (-log |X|, 0), which no point
+    # dominates
+    ref = (-np.log2(p.size / p.shape[-1]), 0.)
+
+    result = {'series': case['series'], 'mapper': case['mapper'],
+              **case['params'],
+              'shape': list(p.shape),
+              'time': min(times),
+              'searched': run_stats['searched'],
+              'pareto_size': len(pset),
+              'hypervolume': pset.hypervolume(ref),
+              'peak_queue_memory': run_stats['peak_queue_memory']}
+
+    # traced separately, tracemalloc slows down the search
+    if memory:
+        tracemalloc.start()
+        mapper(p, **kwargs)
+        result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result
+
+
+def scaling(results):
+    """least squares exponents of time and nodes searched in n, per series
+    and epsilon, from a fit of log(time) against log(n)"""
+    fits = []
+
+    groups = {}
+    for r in results:
+        if 'n' in r:
+            groups.setdefault((r['series'], r['epsilon']), []).append(r)
+
+    for (series, epsilon), rs in sorted(groups.items()):
+        if len(rs) < 3:
+            continue
+
+        n = np.log([r['n'] for r in rs])
+        fit = {'series': series, 'epsilon': epsilon}
+        for key in ['time', 'searched']:
+            fit[key + '_exponent'] = float(
+                np.polyfit(n, np.log([r[key] for r in rs]), 1)[0])
+        fits.append(fit)
+
+    return fits
+
+
+def beam_quality(results):
+    """hypervolume and time of beam searches relative to the epsilon search
+    at the smallest epsilon of the same dataset"""
+    exact = {}
+    for r in sorted(results, key=lambda r: r['epsilon'] or 0, reverse=True):
+        if r['series'] == 'bundled':
+            exact[r['dataset']] = r
+
+    quality = []
+    for r in results:
+        if r['series'] == 'beam' and r['dataset'] in exact:
+            e = exact[r['dataset']]
+            quality.append({'dataset': r['dataset'],
+                            'beam_width': r['beam_width'],
+                            'epsilon': e['epsilon'],
+                            'hypervolume_ratio':
+                                r['hypervolume'] / e['hypervolume'],
+                            'time_ratio': r['time'] / e['time'],
+                            'searched_ratio': r['searched'] / e['searched']})
+
+    return quality
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'],
+                                cwd=os.path.dirname(DATA_DIR),
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+
+    return {'date': datetime.now(timezone.utc).isoformat(),
+            'commit': commit or None,
+            'pareto_dib': os.path.dirname(pareto_dib.__file__),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform()}
+
+
+def compare(results, baseline):
+    """prints time and nodes searched relative to a baseline run"""
+    def key(r):
+        return (r['series'], r.get('dataset'), r.get('n'), r.get('ny'),
+                r['epsilon'], r.get('beam_width'))
+
+    base = {key(r): r for r in baseline['results']}
+
+    print(f"{'case':<40}{'time':>10}{'searched':>10}{'pareto':>10}")
+    for r in results:
+        b = base.get(key(r))
+        if b is None:
+            continue
+
+        name = " ".join(str(x) for x in key(r) if x is not None)
+        print(f"{name:<40}{r['time'] / b['time']:>10.2f}"
+              f"{r['searched'] / b['searched']:>10.2f}"
+              f"{r['pareto_size'] - b['pareto_size']:>+10d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pareto Mapper benchmarks")
+    parser.add_argument('--suite', type=str, default='quick',
+                        help="Suite. Choose from [quick, full].")
+    parser.add_argument('--output', type=str, default=None,
+                        help="JSON file to write the results to.")
+    parser.add_argument('--compare', type=str, default=None,
+                        help="JSON results of a previous run to compare to.")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="Timed runs per case, the minimum is kept.")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="Skip the traced run measuring peak memory.")
+
+    args = parser.parse_args()
+    if args.suite not in ('quick', 'full'):
+        raise Exception(f"Suite: '{args.suite}' not found.")
+
+    results = []
+    for case in suite(args.suite):
+        result = run(case, repeat=args.repeat, memory=not args.no_memory)
+        results.append(result)
+
+        print(json.dumps(result), flush=True)
+
+    report = {'suite': args.suite,
+              'environment': environment(),
+              'results': results,
+              'scaling': scaling(results),
+              'beam_quality': beam_quality(results)}
+
+    for fit in report['scaling'] + report['beam_quality']:
+        print(json.dumps(fit))
+
+    if args.output is not None:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=1)
+
+    if args.compare is not None:
+        with open(args.compare) as fh:
+            compare(results, json.load(fh))
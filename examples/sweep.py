@@ -0,0 +1,52 @@
+import argparse
+
+from pareto_dib import pareto_sweep
+
+# Supported datasets
+
+DSETS = ['alpha27', 'colors', 'Z40x', 'pauli']
+dsets_str = ", ".join(dset for dset in DSETS)
+
+# Parse arguments
+
+parser = argparse.ArgumentParser(description="Pareto Mapper sweeps")
+parser.add_argument('--datasets',
+                    type=str,
+                    nargs='+',
+                    default=['Z40x', 'pauli'],
+                    help=f"Datasets. Choose from [{dsets_str}].")
+parser.add_argument('--epsilons',
+                    type=float,
+                    nargs='+',
+                    default=[1e-8, 1e-6, 1e-4],
+                    help="Search depths run on each dataset.")
+parser.add_argument('--workers',
+                    type=int,
+                    default=None,
+                    help="Number of processes.")
+parser.add_argument('--seed',
+                    type=int,
+                    default=0,
+                    help="Seed of the acceptance draws.")
+parser.add_argument('--store',
+                    type=str,
+                    default='sweep.jsonl',
+                    help="JSON lines file the results are appended to.")
+
+args = parser.parse_args()
+
+for dset in args.datasets:
+    if dset not in DSETS:
+        raise Exception(f"Dataset: '{dset}' not found.")
+
+# Run the sweep
+
+joints = {dset: f"data/pxy_{dset}.npy" for dset in args.datasets}
+records = pareto_sweep(joints, args.epsilons, store=args.store,
+                       workers=args.workers, seed=args.seed)
+
+for record in records:
+    run_stats = record['run_stats']
+    print(f"{record['dataset']:>8} epsilon={record['epsilon']:.0e} "
+          f"frontier={len(record['frontier'])} "
+          f"searched={run_stats['searched']} time={run_stats['time']:.2f}s")
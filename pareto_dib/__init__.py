@@ -1,4 +1,6 @@
-from .pareto_mapper import pareto_mapper
+from .pareto_mapper import iter_pareto_mapper, pareto_mapper
 from .pareto_set import ParetoSet
-from .plotting_utils import pareto_plot
-from .symmetric_pareto_mapper import symmetric_pareto_mapper
+from .plotting_utils import pareto_plot, save_pareto_plots
+from .sweep_utils import load_sweep, pareto_sweep
+from .symmetric_pareto_mapper import (iter_symmetric_pareto_mapper,
+                                      symmetric_pareto_mapper)
@@ -1,10 +1,18 @@
 from collections import defaultdict
 
 import numpy as np
-from scipy.special import rel_entr
+import scipy.sparse as sp
+from scipy.special import rel_entr, xlogy
+
+
+def _dense(p):
+    """densifies a sparse slice of the joint matrix into a flat array"""
+    return p.toarray().ravel() if sp.issparse(p) else p
 
 
 def kl(p, q):
+    p, q = _dense(p), _dense(q)
+
     if np.sum(p) > 0 and np.sum(q) > 0:
         p = p / np.sum(p)
         q = q / np.sum(q)
@@ -22,10 +30,22 @@ def jsd(p, q):
 
 
 def entropy(p):
+    if sp.issparse(p):
+        p = p.data
+
     return - np.sum(p * np.log2(p, out=np.zeros_like(p), where=p != 0))
 
 
 def mutual_information(pxy):
+    if sp.issparse(pxy):
+        # only nonzeros of pxy contribute
+        pxy = sp.coo_matrix(pxy / pxy.sum())
+        px = np.asarray(pxy.sum(1)).ravel()
+        py = np.asarray(pxy.sum(0)).ravel()
+
+        return np.sum(rel_entr(pxy.data, px[pxy.row] * py[pxy.col])) / \
+            np.log(2)
+
     px = np.sum(pxy, 1).reshape(-1, 1)
     py = np.sum(pxy, 0)
     pxpy = px * py
@@ -34,6 +54,7 @@ def mutual_information(pxy):
 
 
 def entropy_diff(px):
+    px = _dense(px)
     pt = px.sum()
 
     return -np.sum(
@@ -45,6 +66,7 @@ def entropy_diff(px):
 
 def weighted_jsd(*argv):
     """takes n unnormalized slices of the joint matrix"""
+    argv = [_dense(p) for p in argv]
 
     ps = np.zeros((len(argv), argv[0].size))
     w = np.zeros(len(argv))
@@ -65,7 +87,86 @@ def weighted_jsd(*argv):
     return wjsd
 
 
+def merge_entropy(w, j, k):
+    """entropy_diff of every pair of cluster weights (w[j], w[k]), in the
+    order of its floating point operations"""
+    wt = w[j] + w[k]
+
+    terms = []
+    for wi in (w[j], w[k]):
+        r = np.divide(wi, wt, out=np.zeros_like(wt), where=wt > 0)
+        terms.append(wi * np.log2(r, out=np.zeros_like(wt), where=wi != 0))
+
+    return -(terms[0] + terms[1])
+
+
+def merge_costs(pxy, pairs=None):
+    """entropy_diff and weighted_jsd of every pair of rows of the joint matrix,
+    returned as upper triangular (m, m) arrays (dH, dI)
+
+    if pairs = (j, k) is given, only pairs j < k are evaluated and other
+    entries are zero; for a sparse pxy only pairs of nonzeros in the same
+    column are visited, see _pair_overlap, otherwise the costs repeat the
+    floating point operations of entropy_diff and weighted_jsd so that
+    merges tie as they do pair by pair"""
+    m = pxy.shape[0]
+    j, k = np.triu_indices(m, 1) if pairs is None else pairs
+
+    if sp.issparse(pxy):
+        w = np.asarray(pxy.sum(1)).ravel()
+        wt = w[j] + w[k]
+
+        dH = np.zeros((m, m))
+        dH[j, k] = -(rel_entr(w[j], wt) + rel_entr(w[k], wt)) / np.log(2)
+
+        pxy = sp.coo_matrix(pxy)
+
+        dI = np.zeros((m, m))
+        dI[j, k] = dH[j, k] - \
+            _pair_overlap(pxy.row, pxy.col, pxy.data, m)[j, k]
+
+        return dH, dI
+
+    w = pxy.sum(1)
+    wt = w[j] + w[k]
+
+    dH = np.zeros((m, m))
+    dH[j, k] = merge_entropy(w, j, k)
+
+    # sum_i w_i * kl(p_i, pt), where kl normalizes both arguments and is
+    # 100000 if either is empty, which empty clusters weigh by zero
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pt = (pxy[j, :] + pxy[k, :]) / wt[:, None]
+        st = pt.sum(1)
+        q = pt / st[:, None]
+
+        div = np.zeros(len(wt))
+        for i in (j, k):
+            d = np.sum(rel_entr(pxy[i, :] / w[i, None], q), 1) / np.log(2)
+            div += np.where((w[i] > 0) & (st > 0), d, 100000.) * w[i]
+
+    dI = np.zeros((m, m))
+    dI[j, k] = div
+
+    return dH, dI
+
+    # sum_i w_i * kl(p_i / w_i, pt / wt), written without normalizing rows
+    # so that empty clusters contribute zero
+    pt = pxy[j, :] + pxy[k, :]
+    div = np.sum(rel_entr(pxy[j, :] * wt[:, None], pt * w[j, None]) +
+                 rel_entr(pxy[k, :] * wt[:, None], pt * w[k, None]), 1)
+
+    dI = np.zeros((m, m))
+    dI[j, k] = np.divide(div, wt, out=np.zeros_like(div),
+                         where=wt > 0) / np.log(2)
+
+    return dH, dI
+
+
 def merge_joint(pxy, cmap):
+    if sp.issparse(pxy):
+        return joint_from_labels(pxy, cmap_to_labels(cmap, pxy.shape[0]))
+
     ret = np.zeros((len(cmap), pxy.shape[1]))
     for c, S in cmap.items():
         for y in S:
@@ -75,6 +176,9 @@ def merge_joint(pxy, cmap):
 
 
 def merge_joint_sym(p, cmap):
+    if sp.issparse(p):
+        return joint_from_labels_sym(p, cmap_to_labels(cmap, _sym_size(p)))
+
     ret = np.zeros((len(cmap), len(cmap), p.shape[2]))
     for cx, Sx in cmap.items():
         for cy, Sy in cmap.items():
@@ -85,6 +189,293 @@ def merge_joint_sym(p, cmap):
     return ret
 
 
+def _xlogx(p):
+    # xlogy uses the C library log, as do the compiled kernels in jit_utils
+    return xlogy(p, p) / np.log(2)
+
+
+def _merge_sum_change(A, symmetric=False):
+    """change in sum(x log2 x) over A when rows and columns j and k of A are
+    merged, as an upper triangular (m, m) array"""
+    m = A.shape[0]
+    j, k = np.triu_indices(m, 1)
+
+    ret = np.zeros((m, m))
+    if m < 2:
+        return ret
+
+    def pair_sums(A):
+        # sum over b of xlogx(A[j, b] + A[k, b]) for every pair j < k
+        ret = np.zeros((m, m))
+        for r in range(m - 1):
+            ret[r, r + 1:] = np.sum(
+                _xlogx(A[r] + A[r + 1:]).reshape(m - r - 1, -1), 1)
+
+        return ret[j, k]
+
+    def single_sums(A):
+        return np.sum(_xlogx(A).reshape(m, -1), 1)
+
+    rows, row_pairs = single_sums(A), pair_sums(A)
+    if symmetric:
+        cols, col_pairs = rows, row_pairs
+    else:
+        # contiguous, so that every sum runs over contiguous rows
+        At = np.ascontiguousarray(A.swapaxes(0, 1))
+        cols, col_pairs = single_sums(At), pair_sums(At)
+
+    def f(*cells):
+        return np.sum(_xlogx(sum(cells)).reshape(len(j), -1), 1)
+
+    Ajj, Ajk, Akj, Akk = A[j, j], A[j, k], A[k, j], A[k, k]
+
+    # merged row and column without their entries in columns and rows j, k,
+    # plus the merged corner
+    new = row_pairs - f(Ajj, Akj) - f(Ajk, Akk) + \
+        col_pairs - f(Ajj, Ajk) - f(Akj, Akk) + f(Ajj, Ajk, Akj, Akk)
+    # rows and columns j and k, counting the corner once
+    old = rows[j] + rows[k] + cols[j] + cols[k] - \
+        f(Ajj) - f(Ajk) - f(Akj) - f(Akk)
+
+    ret[j, k] = new - old
+
+    return ret
+
+
+def _pair_overlap(rows, keys, data, m):
+    """sum of f(a + b) - f(a) - f(b), f(x) = x log2 x, over the entries a and
+    b of each pair of rows j < k stored under the same key, as an upper
+    triangular (m, m) array; entries are (row, key, value) triplets without
+    duplicates, so only keys where both rows are nonzero are visited"""
+    nz = data != 0
+    order = np.lexsort((rows[nz], keys[nz]))
+    rows, keys, data = rows[nz][order], keys[nz][order], data[nz][order]
+
+    # pair every entry with the later entries under the same key
+    _, start, counts = np.unique(keys, return_index=True, return_counts=True)
+    after = np.repeat(start + counts, counts) - np.arange(len(keys)) - 1
+    first = np.repeat(np.arange(len(keys)), after)
+    second = first + 1 + np.arange(len(first)) - \
+        np.repeat(np.cumsum(after) - after, after)
+
+    a, b = data[first], data[second]
+    g = _xlogx(a + b) - _xlogx(a) - _xlogx(b)
+
+    ret = np.bincount(rows[first].astype(np.intp) * m + rows[second],
+                      weights=g, minlength=m * m)
+
+    # bincount returns integers when there are no pairs
+    return ret.reshape(m, m).astype(float)
+
+
+def _sym_size(p):
+    """m of a sparse p_{X1 X2; Y} stored as a (m m, |Y|) matrix"""
+    m = int(np.rint(np.sqrt(p.shape[0])))
+    if m * m != p.shape[0]:
+        raise Exception("sparse joint must have m * m rows")
+
+    return m
+
+
+def _sparse_merge_sum_change(p, symmetric=False):
+    """_merge_sum_change of a sparse p_{X1 X2; Y} stored as a (m m, |Y|)
+    matrix with row x1 m + x2"""
+    m, Zdim = _sym_size(p), p.shape[1]
+    j, k = np.triu_indices(m, 1)
+
+    p = sp.csr_matrix(p)
+    p.sum_duplicates()
+    coo = p.tocoo()
+    x1, x2 = coo.row // m, coo.row % m
+    col = coo.col.astype(np.intp)
+
+    # merged rows and merged columns, counting the corners in both
+    ret = _pair_overlap(x1, x2 * Zdim + col, coo.data, m)
+    if symmetric:
+        ret += ret
+    else:
+        ret += _pair_overlap(x2, x1 * Zdim + col, coo.data, m)
+
+    # corners with an empty off-diagonal are merged diagonal entries
+    diag = x1 == x2
+    ret += _pair_overlap(x1[diag], col[diag], coo.data[diag], m)
+
+    # other corners are computed from their four cells
+    jk = np.unique(np.minimum(x1, x2)[~diag] * m + np.maximum(x1, x2)[~diag])
+    if jk.size:
+        a, b = jk // m, jk % m
+        Ajj, Ajk, Akj, Akk = p[a * m + a], p[a * m + b], p[b * m + a], \
+            p[b * m + b]
+
+        def f(*cells):
+            cells = sp.csr_matrix(sum(cells))
+            rows = np.repeat(np.arange(len(jk)), np.diff(cells.indptr))
+            return np.bincount(rows, weights=_xlogx(cells.data),
+                               minlength=len(jk)).astype(float)
+
+        corner = f(Ajj, Ajk, Akj, Akk) - f(Ajj, Akj) - f(Ajk, Akk) - \
+            f(Ajj, Ajk) - f(Akj, Akk) + f(Ajj) + f(Ajk) + f(Akj) + f(Akk)
+        ret[a, b] += corner - (f(Ajj, Akk) - f(Ajj) - f(Akk))
+
+    out = np.zeros((m, m))
+    out[j, k] = ret[j, k]
+
+    return out
+
+
+def merge_costs_sym(p, symmetric=False):
+    """entropy and information changes of merging every pair of clusters of
+    the joint p_{X1 X2; Y}, the symmetric counterpart of merge_costs
+
+    only the marginals and the merged rows and columns are used, if
+    symmetric then p[x1, x2, y] = p[x2, x1, y] is assumed and columns are
+    not computed
+
+    a sparse p is stored as a (m m, |Y|) matrix with row x1 m + x2, and only
+    its nonzeros are visited"""
+    if sp.issparse(p):
+        p = sp.coo_matrix(p)
+        marginal = sp.coo_matrix((p.data, (p.row, np.zeros_like(p.row))),
+                                 shape=(p.shape[0], 1))
+
+        dH = _sparse_merge_sum_change(marginal, symmetric)
+        dI = dH - _sparse_merge_sum_change(p, symmetric)
+
+        return dH, dI
+
+    dH = _merge_sum_change(p.sum(-1), symmetric)
+    dI = dH - _merge_sum_change(p, symmetric)
+
+    return dH, dI
+
+
+def pack_sym(p):
+    """upper triangle of a symmetric p_{X1 X2; Y}, of shape
+    (m (m + 1) / 2, |Y|)"""
+    return p[np.triu_indices(p.shape[0])]
+
+
+def _packed_size(u):
+    """m of a p_{X1 X2; Y} packed by pack_sym"""
+    return (int(np.rint(np.sqrt(8 * u.shape[0] + 1))) - 1) // 2
+
+
+def _packed_index(a, b, m):
+    """row of entry (a, b), a <= b, in the upper triangle packed by
+    pack_sym"""
+    return a * m - a * (a - 1) // 2 + b - a
+
+
+def unpack_sym(u):
+    """inverse of pack_sym"""
+    m = _packed_size(u)
+    j, k = np.triu_indices(m)
+
+    ret = np.empty((m, m) + u.shape[1:])
+    ret[j, k] = u
+    ret[k, j] = u
+
+    return ret
+
+
+def joint_from_labels(pxy, labels):
+    """label array equivalent of merge_joint"""
+    if sp.issparse(pxy):
+        pxy = sp.coo_matrix(pxy)
+
+        return sp.csr_matrix((pxy.data, (labels[pxy.row], pxy.col)),
+                             shape=(labels.max() + 1, pxy.shape[1]))
+
+    ret = np.zeros((labels.max() + 1,) + pxy.shape[1:])
+    np.add.at(ret, labels, pxy)
+
+    return ret
+
+
+def joint_from_labels_sym(p, labels):
+    """label array equivalent of merge_joint_sym"""
+    if sp.issparse(p):
+        n, m = len(labels), labels.max() + 1
+        p = sp.coo_matrix(p)
+
+        rows = labels[p.row // n].astype(np.intp) * m + labels[p.row % n]
+        return sp.csr_matrix((p.data, (rows, p.col)),
+                             shape=(m * m, p.shape[1]))
+
+    rows = np.zeros((labels.max() + 1,) + p.shape[1:])
+    np.add.at(rows, labels, p)
+
+    ret = np.zeros((rows.shape[0],) + rows.shape[:1] + p.shape[2:])
+    np.add.at(ret, (slice(None), labels), rows)
+
+    return ret
+
+
+def merge_pair(pxy, j, k):
+    """merges rows j and k, equivalent to
+    merge_joint(pxy, single_cluster_cmap(len(pxy), (j, k)))"""
+    if sp.issparse(pxy):
+        m = pxy.shape[0]
+        return joint_from_labels(pxy, merge_labels(identity_labels(m), j, k))
+
+    keep = np.ones(pxy.shape[0], dtype=bool)
+    keep[[j, k]] = False
+
+    ret = np.empty((pxy.shape[0] - 1,) + pxy.shape[1:])
+    ret[:-1] = pxy[keep]
+    ret[-1] = pxy[j] + pxy[k]
+
+    return ret
+
+
+def merge_pair_sym(p, j, k):
+    """merges rows and columns j and k, equivalent to
+    merge_joint_sym(p, single_cluster_cmap(len(p), (j, k)))"""
+    if sp.issparse(p):
+        m = _sym_size(p)
+        return joint_from_labels_sym(p,
+                                     merge_labels(identity_labels(m), j, k))
+
+    keep = np.ones(p.shape[0], dtype=bool)
+    keep[[j, k]] = False
+
+    ret = np.empty((p.shape[0] - 1, p.shape[1] - 1) + p.shape[2:])
+    ret[:-1, :-1] = p[np.ix_(keep, keep)]
+    ret[-1, :-1] = p[j, keep] + p[k, keep]
+    ret[:-1, -1] = p[keep, j] + p[keep, k]
+    ret[-1, -1] = p[j, j] + p[j, k] + p[k, j] + p[k, k]
+
+    return ret
+
+
+def merge_pair_packed(u, j, k):
+    """merge_pair_sym of a symmetric joint packed by pack_sym, equivalent to
+    pack_sym(merge_pair_sym(unpack_sym(u), j, k)) without unpacking
+
+    the kept entries are gathered from the triangle and only the merged row
+    is summed"""
+    m = _packed_size(u)
+    j, k = min(j, k), max(j, k)
+
+    keep = np.delete(np.arange(m), [j, k])
+    a, b = np.triu_indices(m - 1)
+    inner = b < m - 2
+    last = ~inner
+    last[-1] = False
+
+    ret = np.empty((len(a),) + u.shape[1:])
+    ret[inner] = u[_packed_index(keep[a[inner]], keep[b[inner]], m)]
+    ret[last] = u[_packed_index(np.minimum(keep, j), np.maximum(keep, j), m)] \
+        + u[_packed_index(np.minimum(keep, k), np.maximum(keep, k), m)]
+
+    # p[j, k] and p[k, j] are the same entry, summed in the order of
+    # merge_pair_sym
+    jj, jk, kk = _packed_index(np.array([j, j, k]), np.array([j, k, k]), m)
+    ret[-1] = u[jj] + u[jk] + u[jk] + u[kk]
+
+    return ret
+
+
 def single_cluster_cmap(n, cluster):
     c = 0
     cmap = defaultdict(set)
@@ -118,3 +509,69 @@ def combine_cmaps(cmap1, cmap2):
                 cmap[c].add(elem)
 
     return cmap
+
+
+def identity_labels(n):
+    """label array of the identity clustering of n elements, using the
+    smallest integer type that can hold n labels"""
+    return np.arange(n, dtype=np.min_scalar_type(max(n - 1, 0)))
+
+
+def cmap_to_labels(cmap, n=None):
+    """converts a cmap dict into an array mapping each x to its cluster"""
+    if n is None:
+        n = sum(len(S) for S in cmap.values())
+
+    labels = identity_labels(n)
+    for c, S in cmap.items():
+        labels[list(S)] = c
+
+    return labels
+
+
+def labels_to_cmap(labels):
+    """converts a label array into a cmap dict"""
+    cmap = defaultdict(set)
+
+    for x, c in enumerate(labels.tolist()):
+        cmap[c].add(x)
+
+    return dict(sorted(cmap.items()))
+
+
+def compose_labels(labels1, labels2):
+    """apply labels1 first then labels2, the label array equivalent of
+    combine_cmaps"""
+    if labels1.max() + 1 != len(labels2):
+        raise Exception("labels don't match")
+
+    return labels2[labels1]
+
+
+def merge_labels(labels, j, k, m=None):
+    """merges clusters j and k, equivalent to
+    combine_cmaps(cmap, single_cluster_cmap(m, (j, k)))"""
+    if m is None:
+        m = labels.max() + 1
+
+    relabel = np.empty(m, dtype=labels.dtype)
+    keep = np.ones(m, dtype=bool)
+    keep[[j, k]] = False
+    relabel[keep] = np.arange(m - 2)
+    relabel[[j, k]] = m - 2
+
+    return relabel[labels]
+
+
+def canonical_labels(labels):
+    """relabels clusters in order of their first element, the restricted
+    growth string of the partition, which is the same for every labelling
+    of a partition"""
+    _, first, inverse = np.unique(labels, return_index=True,
+                                  return_inverse=True)
+
+    rank = np.empty(len(first), dtype=np.min_scalar_type(
+        max(len(labels) - 1, 0)))
+    rank[np.argsort(first)] = np.arange(len(first))
+
+    return rank[inverse.reshape(-1)]
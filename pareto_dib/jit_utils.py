@@ -0,0 +1,373 @@
+"""Compiled counterparts of the merge kernels in classification_utils.
+
+The kernels repeat the floating point operations of the NumPy kernels in the
+same order, including the pairwise summation used by numpy.sum and the C
+library logarithms used by scipy.special, so both backends give identical
+frontiers.
+"""
+import math
+import sys
+import warnings
+
+import numpy as np
+import scipy.sparse as sp
+
+from . import classification_utils
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+BACKENDS = ('numpy', 'numba')
+
+_LN2 = math.log(2)
+_DBL_MIN = sys.float_info.min
+
+# numpy.sum sums blocks of up to 128 elements with 8 accumulators
+_PW_BLOCKSIZE = 128
+
+
+def _block_sum(a, start, n):
+    if n < 8:
+        res = 0.
+        for i in range(start, start + n):
+            res += a[i]
+        return res
+
+    r0, r1, r2, r3 = a[start], a[start + 1], a[start + 2], a[start + 3]
+    r4, r5, r6, r7 = a[start + 4], a[start + 5], a[start + 6], a[start + 7]
+
+    i = 8
+    while i < n - n % 8:
+        r0 += a[start + i]
+        r1 += a[start + i + 1]
+        r2 += a[start + i + 2]
+        r3 += a[start + i + 3]
+        r4 += a[start + i + 4]
+        r5 += a[start + i + 5]
+        r6 += a[start + i + 6]
+        r7 += a[start + i + 7]
+        i += 8
+
+    res = ((r0 + r1) + (r2 + r3)) + ((r4 + r5) + (r6 + r7))
+    while i < n:
+        res += a[start + i]
+        i += 1
+    return res
+
+
+def _pairwise_sum(a, start, n):
+    # sum of a[start:start + n] in the order of numpy.sum, which halves the
+    # range into multiples of 8 until blocks are small enough; the recursion
+    # is unrolled into a stack since numba cannot cache recursive functions
+    if n <= _PW_BLOCKSIZE:
+        return _block_sum(a, start, n)
+
+    lo = np.empty(64, dtype=np.intp)
+    size = np.empty(64, dtype=np.intp)
+    left = np.empty(64)
+    on_right = np.zeros(64, dtype=np.bool_)
+
+    d = 0
+    lo[0], size[0] = start, n
+    while True:
+        if size[d] > _PW_BLOCKSIZE:
+            half = size[d] // 2
+            half -= half % 8
+            on_right[d] = False
+            lo[d + 1], size[d + 1] = lo[d], half
+            d += 1
+            continue
+
+        # return the block sum up the stack until a right half is pending
+        v = _block_sum(a, lo[d], size[d])
+        while True:
+            d -= 1
+            if d < 0:
+                return v
+            if on_right[d]:
+                v = left[d] + v
+            else:
+                half = size[d] // 2
+                half -= half % 8
+                left[d], on_right[d] = v, True
+                lo[d + 1], size[d + 1] = lo[d] + half, size[d] - half
+                d += 1
+                break
+
+
+def _rel_entr(x, y):
+    # scipy.special.rel_entr
+    if x > 0. and y > 0.:
+        ratio = x / y
+        if 0.5 < ratio < 2.:
+            return x * math.log1p((x - y) / y)
+        if _DBL_MIN < ratio < math.inf:
+            return x * math.log(ratio)
+        return x * (math.log(x) - math.log(y))
+    elif x == 0. and y >= 0.:
+        return 0.
+    elif math.isnan(x) or math.isnan(y):
+        return math.nan
+    return math.inf
+
+
+def _xlogx(x):
+    # classification_utils._xlogx
+    return (x * math.log(x) if x != 0. else 0.) / _LN2
+
+
+def _merge_costs(pxy, J, K):
+    # dI of classification_utils.merge_costs, see merge_costs for dH
+    m, n = pxy.shape
+
+    w = np.empty(m)
+    for j in range(m):
+        w[j] = _pairwise_sum(pxy[j], 0, n)
+
+    dI = np.zeros((m, m))
+    pt = np.empty(n)
+    q = np.empty(n)
+    div = np.empty(n)
+    for i in range(len(J)):
+        j, k = J[i], K[i]
+
+        # both kl terms are 100000 weighed by zero
+        wt = w[j] + w[k]
+        if wt == 0.:
+            continue
+
+        for y in range(n):
+            pt[y] = (pxy[j, y] + pxy[k, y]) / wt
+        st = _pairwise_sum(pt, 0, n)
+        if st > 0.:
+            for y in range(n):
+                q[y] = pt[y] / st
+
+        d = 0.
+        for r in (j, k):
+            if w[r] > 0. and st > 0.:
+                for y in range(n):
+                    div[y] = _rel_entr(pxy[r, y] / w[r], q[y])
+                kl = _pairwise_sum(div, 0, n) / _LN2
+            else:
+                kl = 100000.
+            d += kl * w[r]
+
+        dI[j, k] = d
+
+    return dI
+
+
+def _row_sums(A):
+    # sum over b, y of xlogx(A[r, b, y]) of every row r, and of
+    # xlogx(A[j, b, y] + A[k, b, y]) of every pair of rows j < k
+    m, z = A.shape[0], A.shape[2]
+
+    rows = np.empty(m)
+    pairs = np.zeros((m, m))
+    buf = np.empty(m * z)
+
+    for r in range(m):
+        for b in range(m):
+            for y in range(z):
+                buf[b * z + y] = _xlogx(A[r, b, y])
+        rows[r] = _pairwise_sum(buf, 0, m * z)
+
+        for k in range(r + 1, m):
+            for b in range(m):
+                for y in range(z):
+                    buf[b * z + y] = _xlogx(A[r, b, y] + A[k, b, y])
+            pairs[r, k] = _pairwise_sum(buf, 0, m * z)
+
+    return rows, pairs
+
+
+# cells of the corner (Ajj, Ajk, Akj, Akk) summed by each term of
+# _merge_sum_change, in the order of the NumPy kernel
+_CORNER_TERMS = np.array([[1, 0, 1, 0], [0, 1, 0, 1], [1, 1, 0, 0],
+                          [0, 0, 1, 1], [1, 1, 1, 1], [1, 0, 0, 0],
+                          [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]],
+                         dtype=np.bool_)
+
+
+def _corner_sum(corner, cells, buf):
+    # sum over y of xlogx of the sum of the selected cells of the corner
+    z = corner.shape[1]
+    for y in range(z):
+        x = 0.
+        for i in range(4):
+            if cells[i]:
+                x += corner[i, y]
+        buf[y] = _xlogx(x)
+
+    return _pairwise_sum(buf, 0, z)
+
+
+def _merge_sum_change(A, symmetric):
+    # classification_utils._merge_sum_change of a (m, m, z) array
+    m, z = A.shape[0], A.shape[2]
+
+    ret = np.zeros((m, m))
+    if m < 2:
+        return ret
+
+    rows, row_pairs = _row_sums(A)
+    if symmetric:
+        cols, col_pairs = rows, row_pairs
+    else:
+        cols, col_pairs = _row_sums(A.transpose(1, 0, 2))
+
+    buf = np.empty(z)
+    corner = np.empty((4, z))
+    f = np.empty(len(_CORNER_TERMS))
+    for j in range(m):
+        for k in range(j + 1, m):
+            corner[0], corner[1] = A[j, j], A[j, k]
+            corner[2], corner[3] = A[k, j], A[k, k]
+            for t in range(len(_CORNER_TERMS)):
+                f[t] = _corner_sum(corner, _CORNER_TERMS[t], buf)
+
+            new = row_pairs[j, k] - f[0] - f[1] + col_pairs[j, k] - \
+                f[2] - f[3] + f[4]
+            old = rows[j] + rows[k] + cols[j] + cols[k] - f[5] - f[6] - \
+                f[7] - f[8]
+
+            ret[j, k] = new - old
+
+    return ret
+
+
+def _merge_costs_sym(p, symmetric):
+    m, z = p.shape[0], p.shape[2]
+
+    A = np.empty((m, m, 1))
+    for a in range(m):
+        for b in range(m):
+            A[a, b, 0] = _pairwise_sum(p[a, b], 0, z)
+
+    dH = _merge_sum_change(A, symmetric)
+    dI = dH - _merge_sum_change(p, symmetric)
+
+    return dH, dI
+
+
+def _merge_pair(pxy, j, k):
+    m, n = pxy.shape
+
+    ret = np.empty((m - 1, n))
+    i = 0
+    for a in range(m):
+        if a != j and a != k:
+            ret[i] = pxy[a]
+            i += 1
+    ret[m - 2] = pxy[j] + pxy[k]
+
+    return ret
+
+
+def _merge_pair_sym(p, j, k):
+    m, z = p.shape[0], p.shape[2]
+
+    keep = np.empty(m - 2, dtype=np.intp)
+    i = 0
+    for a in range(m):
+        if a != j and a != k:
+            keep[i] = a
+            i += 1
+
+    ret = np.empty((m - 1, m - 1, z))
+    for a in range(m - 2):
+        for b in range(m - 2):
+            ret[a, b] = p[keep[a], keep[b]]
+        ret[m - 2, a] = p[j, keep[a]] + p[k, keep[a]]
+        ret[a, m - 2] = p[keep[a], j] + p[keep[a], k]
+    ret[m - 2, m - 2] = p[j, j] + p[j, k] + p[k, j] + p[k, k]
+
+    return ret
+
+
+if njit is not None:
+    _block_sum = njit(cache=True)(_block_sum)
+    _pairwise_sum = njit(cache=True)(_pairwise_sum)
+    _rel_entr = njit(cache=True)(_rel_entr)
+    _xlogx = njit(cache=True)(_xlogx)
+    _merge_costs = njit(cache=True)(_merge_costs)
+    _row_sums = njit(cache=True)(_row_sums)
+    _corner_sum = njit(cache=True)(_corner_sum)
+    _merge_sum_change = njit(cache=True)(_merge_sum_change)
+    _merge_costs_sym = njit(cache=True)(_merge_costs_sym)
+    _merge_pair = njit(cache=True)(_merge_pair)
+    _merge_pair_sym = njit(cache=True)(_merge_pair_sym)
+
+
+def merge_costs(pxy, pairs=None):
+    """compiled merge_costs, sparse joints use the NumPy kernel, as does dH,
+    whose numpy.log2 may round differently from the C library"""
+    if sp.issparse(pxy):
+        return classification_utils.merge_costs(pxy, pairs)
+
+    pxy = np.asarray(pxy, dtype=float)
+    m = pxy.shape[0]
+    j, k = np.triu_indices(m, 1) if pairs is None else pairs
+
+    dH = np.zeros((m, m))
+    dH[j, k] = classification_utils.merge_entropy(pxy.sum(1), j, k)
+
+    return dH, _merge_costs(pxy, np.asarray(j, dtype=np.intp),
+                            np.asarray(k, dtype=np.intp))
+
+
+def merge_costs_sym(p, symmetric=False):
+    """compiled merge_costs_sym, sparse joints use the NumPy kernel"""
+    if sp.issparse(p):
+        return classification_utils.merge_costs_sym(p, symmetric)
+
+    return _merge_costs_sym(np.asarray(p, dtype=float), symmetric)
+
+
+def merge_pair(pxy, j, k):
+    """compiled merge_pair, sparse joints use the NumPy kernel"""
+    if sp.issparse(pxy):
+        return classification_utils.merge_pair(pxy, j, k)
+
+    return _merge_pair(np.asarray(pxy, dtype=float), j, k)
+
+
+def merge_pair_sym(p, j, k):
+    """compiled merge_pair_sym, sparse joints use the NumPy kernel"""
+    if sp.issparse(p):
+        return classification_utils.merge_pair_sym(p, j, k)
+
+    return _merge_pair_sym(np.asarray(p, dtype=float), j, k)
+
+
+def get_kernels(backend='numpy'):
+    """merge_costs, merge_costs_sym, merge_pair and merge_pair_sym of a
+    backend, 'numba' falls back to 'numpy' with a warning if numba is not
+    importable
+
+    Args:
+        backend (str): one of BACKENDS
+
+    Returns:
+        str: backend in use
+        tuple: kernels
+
+    """
+    if backend not in BACKENDS:
+        raise ValueError("backend must be one of {}".format(BACKENDS))
+
+    if backend == 'numba' and njit is None:
+        warnings.warn("numba is not importable, using the numpy backend")
+        backend = 'numpy'
+
+    if backend == 'numba':
+        module = sys.modules[__name__]
+    else:
+        module = classification_utils
+
+    return backend, (module.merge_costs, module.merge_costs_sym,
+                     module.merge_pair, module.merge_pair_sym)
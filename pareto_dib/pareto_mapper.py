@@ -1,84 +1,326 @@
-from time import time
+from functools import partial
 
 import numpy as np
+import scipy.sparse as sp
 
-from .classification_utils import (combine_cmaps, entropy, entropy_diff,
-                                   merge_joint, mutual_information,
-                                   single_cluster_cmap, weighted_jsd)
-from .pareto_set import ParetoSet
+from .classification_utils import (entropy, identity_labels,
+                                   joint_from_labels, merge_costs,
+                                   mutual_information)
+from .jit_utils import get_kernels
+from .search_utils import iter_beam_search, iter_pareto_search, make_rng
 
 
-def pareto_mapper(p, epsilon=1e-8):
+def _evaluate(nent, mi, pc, labels=None, costs=merge_costs):
+    dH, dI = costs(pc)
+
+    return nent + dH, mi - dI
+
+
+class MergeCostCache:
+    """Bounded cache of the merge costs of pairs of clusters.
+
+    The cost of merging two clusters only depends on their members, so pairs
+    are keyed by the Zobrist hashes of the two clusters, the XOR of random
+    64 bit keys of their members, and reused across search branches. Entries
+    are kept in two generations of size / 2, a pair found in the older
+    generation is moved to the newer one and the older generation is dropped
+    when the newer one is full, which approximates least recently used
+    eviction without reordering on every hit.
+    """
+
+    # odd multiplier combining the two cluster hashes of a pair
+    _MIX = np.uint64(0x9E3779B97F4A7C15)
+
+    def __init__(self, n, size, costs=merge_costs):
+        """
+        Args:
+            n (int): number of elements
+            size (int): maximum number of cached pairs
+            costs (callable): costs(joint, pairs) returns the (dH, dI) of the
+                given pairs, see merge_costs
+
+        """
+        self.size = size
+        self.costs = costs
+
+        # fixed keys, so that the search draws are not consumed
+        self._keys = np.random.default_rng(0).integers(
+            np.iinfo(np.uint64).max, size=n, dtype=np.uint64)
+
+        # costs are stored as dH + 1j dI, so that a lookup is a single get
+        self._recent = {}
+        self._old = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._recent) + len(self._old)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
+
+    def _store(self, key, cost):
+        self._recent[key] = cost
+
+        if len(self._recent) >= max(self.size // 2, 1):
+            self._old, self._recent = self._recent, {}
+
+    def __call__(self, nent, mi, pc, labels):
+        m = pc.shape[0]
+
+        clusters = np.zeros(m, dtype=np.uint64)
+        np.bitwise_xor.at(clusters, labels, self._keys)
+
+        J, K = np.triu_indices(m, 1)
+        lo = np.minimum(clusters[J], clusters[K])
+        hi = np.maximum(clusters[J], clusters[K])
+        keys = (lo * self._MIX + hi).tolist()
+
+        costs = list(map(self._recent.get, keys))
+        missed = [i for i, cost in enumerate(costs) if cost is None]
+
+        if missed and self._old:
+            old = [self._old.get(keys[i]) for i in missed]
+            for i, cost in zip(missed, old):
+                if cost is not None:
+                    costs[i] = cost
+                    self._store(keys[i], cost)
+            missed = [i for i, cost in zip(missed, old) if cost is None]
+
+        if missed:
+            pairs = (J[missed], K[missed])
+            dH, dI = self.costs(pc, pairs)
+
+            new = np.empty(len(missed), dtype=complex)
+            new.real, new.imag = dH[pairs], dI[pairs]
+            for i, cost in zip(missed, new.tolist()):
+                costs[i] = cost
+                self._store(keys[i], cost)
+
+        self.hits += len(J) - len(missed)
+        self.misses += len(missed)
+
+        costs = np.array(costs, dtype=complex)
+
+        dH = np.zeros((m, m))
+        dI = np.zeros((m, m))
+        dH[J, K], dI[J, K] = costs.real, costs.imag
+
+        return nent + dH, mi - dI
+
+
+def pareto_mapper(p, epsilon=1e-8, seed=None, workers=None,
+                  checkpoint=None, checkpoint_interval=600.,
+                  resume_from=None, max_queue_memory=None, backend='numpy',
+                  cache_size=None, dedup='partition', profile=False,
+                  order='lifo', beam_width=None, warm_start=None,
+                  store_joints=True):
     """
     Pareto Mapper
 
         Parameters:
-                p (numpy.ndarray): joint distribution
+                p (numpy.ndarray or scipy.sparse matrix): joint
+                    distribution, a sparse p is kept sparse (CSR) throughout
                 eps (float, optional): search depth, default 1e-12
+                seed (int or numpy.random.Generator, optional): seed of the
+                    acceptance draws, default None draws a fresh seed which
+                    is reported in run_stats
+                workers (int, optional): number of processes used to evaluate
+                    merges, default None runs in a single process
+                checkpoint (str, optional): file to periodically save the
+                    search state to
+                checkpoint_interval (float, optional): seconds between
+                    checkpoints, default 600
+                resume_from (str, optional): checkpoint of an interrupted
+                    search of the same joint to resume
+                max_queue_memory (int, optional): bytes of joints kept in the
+                    search queue, joints beyond it are rebuilt when popped,
+                    the up to 2 workers points evaluated ahead of time by
+                    the pool are not counted, default None is unbounded
+                backend (str, optional): 'numpy' (default) or 'numba' for
+                    compiled merge kernels, which give identical frontiers
+                    and fall back to 'numpy' if numba is not importable
+                cache_size (int or MergeCostCache, optional): number of
+                    cluster pairs whose merge costs are cached across search
+                    branches, or a MergeCostCache of the same joint and
+                    backend shared with previous runs, see MergeCostCache,
+                    default None disables the cache, it cannot be combined
+                    with workers
+                dedup (str, optional): 'partition' (default) searches each
+                    partition once, 'coordinates' searches each (-H, I)
+                    rounded to 8 decimals once
+                profile (bool, optional): if True, run_stats['profile'] holds
+                    the time spent per phase of the search (merge cost
+                    evaluation, joint merging, label construction, dedup,
+                    ParetoSet operations, queue management), counts of
+                    children generated, kept and deduped, and the queue depth
+                    before each searched point, see SearchProfile
+                order (str, optional): 'lifo' (default) searches the last
+                    queued partition first, 'best' the one closest to the
+                    frontier and in its widest gap, which covers the whole
+                    frontier sooner in a search stopped by a budget of
+                    iter_pareto_mapper
+                beam_width (int, optional): if given, runs a beam search
+                    keeping the beam_width best partitions of each number
+                    of clusters instead of the epsilon search, in time and
+                    memory linear in beam_width, see iter_beam_search,
+                    epsilon and seed are then unused and it cannot be
+                    combined with workers, checkpoints or order
+                warm_start (int, optional): number of greedy agglomerative
+                    sweeps, the first merging the pair losing the least I per
+                    H gained and the others drawing among the 3 best pairs,
+                    whose partitions seed the frontier and the queue before
+                    the search so that it prunes against a good frontier
+                    from the start, which searches far fewer partitions but
+                    can miss frontier points only reached through partitions
+                    it prunes, see greedy_sweeps, default None starts from an
+                    empty frontier
+                store_joints (bool, optional): if False, the frontier keeps
+                    (-H, I, labels, None) tuples instead of holding the joint
+                    of each of its points, which pset.get_joint(i) rebuilds
+                    from p, default True
 
         Returns:
-                pset (ParetoSet): DIB Pareto frontier
+                pset (ParetoSet): DIB Pareto frontier of (-H, I, labels, pc)
+                    tuples, where labels maps each x to its cluster
                 run_stats (dict): performance statistics
     """
-    n = p.shape[0]
+    for kind, data in iter_pareto_mapper(
+            p, epsilon=epsilon, seed=seed, workers=workers,
+            checkpoint=checkpoint, checkpoint_interval=checkpoint_interval,
+            resume_from=resume_from, max_queue_memory=max_queue_memory,
+            backend=backend, cache_size=cache_size, dedup=dedup,
+            profile=profile, order=order, beam_width=beam_width,
+            warm_start=warm_start, store_joints=store_joints,
+            stats_interval=None):
+        pass
 
-    # plot pruned search points
-    cmap0 = {x: {x, } for x in range(p.shape[0])}
+    return data
 
-    pset = ParetoSet()
-    Imax = mutual_information(p)
-    Hmax = -entropy(p.sum(1))
-    new_point = (Hmax, Imax, cmap0, p)
 
-    Q = []
-    Q.append(new_point)
+def iter_pareto_mapper(p, epsilon=1e-8, seed=None, workers=None,
+                       checkpoint=None, checkpoint_interval=600.,
+                       resume_from=None, max_queue_memory=None,
+                       backend='numpy', cache_size=None, dedup='partition',
+                       profile=False, order='lifo', beam_width=None,
+                       warm_start=None, store_joints=True, max_time=None,
+                       max_nodes=None, max_stable=None, stats_interval=1.):
+    """
+    Pareto Mapper as a generator of frontier updates
 
-    tried = set()
-    count = 0
-    t0 = time()
+        Parameters:
+                p, epsilon, seed, workers, checkpoint, checkpoint_interval,
+                resume_from, max_queue_memory, backend, cache_size, dedup,
+                profile, order, beam_width, warm_start, store_joints: see
+                pareto_mapper
+                max_time (float, optional): seconds after which the search
+                    stops, default None is unbounded
+                max_nodes (int, optional): number of searched points after
+                    which the search stops, default None is unbounded
+                max_stable (int, optional): number of consecutive searched
+                    points leaving the frontier unchanged after which the
+                    search stops, default None is unbounded
+                stats_interval (float, optional): seconds between stats
+                    events, default 1, None yields none
 
-    while Q:
-        count += 1
-        point = Q.pop()
-        nent, mi, cmap, pc = point
+        Yields:
+                ('insert', point) and ('remove', point) as (-H, I, labels,
+                    pc) tuples enter and leave the frontier, pc is None if
+                    store_joints is False
+                ('stats', stats) periodic snapshots of the search statistics
+                ('done', (pset, run_stats)) last, the frontier found so far
+                    and the run stats of pareto_mapper, where
+                    run_stats['stopped'] is the budget that stopped the
+                    search, or None if it completed
+    """
+    # kernels sum contiguous rows, see jit_utils
+    if sp.issparse(p):
+        p = sp.csr_matrix(p, dtype=float)
+    else:
+        p = np.ascontiguousarray(p, dtype=float)
 
-        for j in range(len(cmap)):
-            for k in range(len(cmap)):
-                if j >= k:
-                    continue
+    n = p.shape[0]
 
-                dy = weighted_jsd(pc[j, :], pc[k, :])
-                dx = entropy_diff(pc.sum(1)[[j, k]])
+    # cluster assignments are stored as label arrays, see labels_to_cmap
+    labels0 = identity_labels(n)
 
-                dcmap = single_cluster_cmap(len(cmap), (j, k))
+    Imax = mutual_information(p)
+    Hmax = -entropy(np.asarray(p.sum(1)).ravel())
+    new_point = (Hmax, Imax, labels0, p)
 
-                ncmap = combine_cmaps(cmap, dcmap)
+    rng, seed = make_rng(seed)
+    backend, (costs, _, merge, _) = get_kernels(backend)
 
-                new_point = (nent + dx,
-                             mi - dy,
-                             ncmap,
-                             merge_joint(pc, dcmap))
+    if cache_size is None:
+        cache = None
+        evaluate = partial(_evaluate, costs=costs)
+    elif workers is not None and workers > 1:
+        raise ValueError("cache_size requires workers=None")
+    elif isinstance(cache_size, MergeCostCache):
+        cache = evaluate = cache_size
+    else:
+        cache = evaluate = MergeCostCache(n, cache_size, costs)
 
-                # evaluate point, and attempt insertion into Pareto Set
-                pset.add(new_point)
-                a = pset.is_pareto(new_point)
-                b = np.exp(-pset.distance(new_point) /
-                           epsilon) > np.random.rand()
+    # a shared cache reports the hit rate of this run only
+    if cache is not None:
+        hits, misses = cache.hits, cache.misses
 
-                # check that point has not been tried
-                pid = (round(new_point[0], 8), round(new_point[1], 8))
-                if (a or b) and (pid not in tried):
-                    tried.add(pid)
-                    Q.append(new_point)
+    if beam_width is None:
+        events = iter_pareto_search(new_point, evaluate, merge, epsilon, rng,
+                                    workers=workers,
+                                    joint=partial(joint_from_labels, p),
+                                    checkpoint=checkpoint,
+                                    checkpoint_interval=checkpoint_interval,
+                                    resume_from=resume_from,
+                                    max_queue_memory=max_queue_memory,
+                                    dedup=dedup,
+                                    profile=profile,
+                                    order=order,
+                                    warm_start=warm_start,
+                                    store_joints=store_joints,
+                                    max_time=max_time,
+                                    max_nodes=max_nodes,
+                                    max_stable=max_stable,
+                                    stats_interval=stats_interval)
+    elif (workers is not None and workers > 1) or checkpoint is not None or \
+            resume_from is not None or max_queue_memory is not None or \
+            order != 'lifo' or warm_start:
+        raise ValueError("beam_width cannot be combined with workers, "
+                         "checkpoint, resume_from, max_queue_memory, order "
+                         "or warm_start")
+    else:
+        events = iter_beam_search(new_point, evaluate, merge, beam_width,
+                                  dedup=dedup,
+                                  profile=profile,
+                                  store_joints=store_joints,
+                                  max_time=max_time,
+                                  max_nodes=max_nodes,
+                                  max_stable=max_stable,
+                                  stats_interval=stats_interval)
 
-    tf = time()
+    for kind, data in events:
+        if kind != 'done':
+            yield kind, data
+    pset, stats = data
+    pset.joint = partial(joint_from_labels, p)
 
     # save run stats
     run_stats = {}
     run_stats['n'] = n
-    run_stats['searched'] = count
-    run_stats['time'] = float(tf - t0)
+    run_stats.update(stats)
     run_stats['pareto_size'] = len(pset)
     run_stats['epsilon'] = epsilon
+    run_stats['seed'] = seed
+    run_stats['workers'] = workers
+    run_stats['backend'] = backend
+    if cache is not None:
+        hits, misses = cache.hits - hits, cache.misses - misses
+        lookups = hits + misses
+        run_stats['cache_hit_rate'] = hits / lookups if lookups else 0.
+    else:
+        run_stats['cache_hit_rate'] = None
 
-    return pset, run_stats
+    yield 'done', (pset, run_stats)
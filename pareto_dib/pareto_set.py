@@ -1,17 +1,116 @@
+import os
+from functools import partial
+
 import numpy as np
-from sortedcontainers import SortedKeyList
 
 
-class ParetoSet(SortedKeyList):
-    """Maintained maximal set with efficient insertion."""
+def upper_hull(points):
+    """Upper convex hull of points, by Andrew's monotone chain.
+
+    Args:
+        points (numpy.ndarray): array of shape (N, 2)
+
+    Returns:
+        numpy.ndarray: indices of the points on the upper hull by increasing
+            first coordinate, including points on its edges
+
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+
+    # highest point of each first coordinate, by increasing first coordinate
+    order = np.lexsort((-points[:, 1], points[:, 0]))
+    order = order[np.diff(points[order, 0], prepend=-np.inf) != 0]
+    X, Y = points[order, 0].tolist(), points[order, 1].tolist()
+
+    hull = []
+    for i in range(len(order)):
+        # pop the last point while it is strictly below the chord to i
+        while len(hull) > 1:
+            a, b = hull[-2], hull[-1]
+            if (X[b] - X[a]) * (Y[i] - Y[a]) <= (Y[b] - Y[a]) * (X[i] - X[a]):
+                break
+            hull.pop()
+        hull.append(i)
+
+    return order[hull]
+
+
+def _unstack(coords, labels):
+    # (-H, I, labels, None) tuples of a set saved with labels, see load
+    return [(H, I, x, None) for (H, I), x in zip(coords.tolist(), labels)]
 
-    def __new__(cls, *args, **kwargs):
-        return super().__new__(cls, key=lambda x: x[0])
 
-    def __init__(self, tol=1e-8):
-        super().__init__()
+def _read_points(file, coords):
+    with np.load(file) as archive:
+        return _unstack(coords, archive['labels'])
+
+
+def _separated(a, tol):
+    # True if all elements of a are more than tol apart
+    return bool(np.all(np.diff(np.sort(a)) > tol))
+
+
+class ParetoSet:
+    """Maintained maximal set with efficient insertion.
+
+    The first two indices of each tuple are kept in contiguous float arrays
+    sorted by the first index, separately from the tuples themselves.
+    """
+
+    # point classes returned by classify
+    DOMINATED = 0
+    FRONTIER = 1
+    NEW = 2
+
+    def __init__(self, tol=1e-8, store_joints=True):
+        """
+        Args:
+            tol (float, optional): tolerance of the comparisons of the first
+                two indices, default 1e-8
+            store_joints (bool, optional): if False, (-H, I, labels, joint)
+                tuples are stored as (-H, I, labels, None), see get_joint,
+                default True
 
+        """
         self.tol = tol
+        self.store_joints = store_joints
+
+        # incremented whenever the set changes
+        self.version = 0
+
+        # if a list, changes are appended to it as ('insert', p) and
+        # ('remove', p) events
+        self.changes = None
+
+        # if callable, joint(labels) rebuilds the joint of a (-H, I, labels,
+        # None) point, see get_joint
+        self.joint = None
+
+        self._x = np.empty(0)
+        self._y = np.empty(0)
+        self._points = []
+
+    @property
+    def _points(self):
+        # tuples of a loaded set are read on first access, see load
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            self._point_list = pending()
+        return self._point_list
+
+    @_points.setter
+    def _points(self, points):
+        self._pending = None
+        self._point_list = points
+
+    def __len__(self):
+        return len(self._x)
+
+    def __iter__(self):
+        return iter(self._points)
+
+    def __getitem__(self, idx):
+        return self._points[idx]
 
     def add(self, p):
         """Insert tuple into set if maximal in first two indices.
@@ -23,25 +122,124 @@ class ParetoSet(SortedKeyList):
             bool: True only if point is inserted
 
         """
-        if len(self) == 0:
-            super().add(p)
-            return True
-
-        if not self.is_pareto(p) or p in self:
+        status, _ = self._classify(np.array([p[0]]), np.array([p[1]]))
+        if status[0] != self.NEW:
             return False
 
-        # remove dominated points on the left
-        idx = self.bisect_left(p) - 1
-        while idx + 1 < len(self) and \
-                np.abs(self[idx + 1][0] - p[0]) < self.tol:
-            idx += 1
-        while idx >= 0 and self[idx][1] - p[1] < self.tol:
-            self.pop(idx)
-            idx -= 1
+        # remove dominated points on the left, including points within tol
+        # of p in the first index
+        end = max(np.searchsorted(self._x, p[0]),
+                  np.searchsorted(self._x, p[0] + self.tol))
+        kept = np.flatnonzero(self._y[:end] - p[1] >= self.tol)
+        start = kept[-1] + 1 if kept.size else 0
+
+        self._remove(start, end)
+        self._insert(p)
 
-        super().add(p)
         return True
 
+    def add_many(self, points):
+        """Insert tuples that are maximal in first two indices, sorting the
+        batch once and merging it with the set in a single pass.
+
+        The result is that of calling add on each tuple in turn. If tuples
+        new to the set are within tol of each other or of the set in either
+        index, where the result of add depends on the order of insertion,
+        they are inserted by add in the order of the batch.
+
+        Args:
+            points (iterable): tuples to insert
+
+        Returns:
+            int: number of tuples from the batch in the updated set
+
+        """
+        points = list(points)
+        if len(points) == 0:
+            return 0
+
+        # tuples already in the set are not inserted, as in add
+        coords = np.array([p[0:2] for p in points], dtype=float)
+        status, _ = self._classify(coords[:, 0], coords[:, 1])
+        new = np.flatnonzero(status == self.NEW)
+
+        x = np.r_[self._x, coords[new, 0]]
+        y = np.r_[self._y, coords[new, 1]]
+
+        # the comparisons of add are exact for points more than tol apart
+        if not (_separated(x, self.tol) and _separated(y, self.tol)):
+            return self._add_each(points)
+
+        # sweep from the right, keeping points more than tol above every
+        # point on their right
+        order = np.lexsort((y, x))
+        right = np.maximum.accumulate(y[order][::-1])[::-1]
+        keep = order[y[order] - np.r_[right[1:], -np.inf] > self.tol]
+
+        inserted = int(np.sum(keep >= len(self)))
+        if inserted == 0:
+            return 0
+
+        merged = self._points + [self._stored(points[i]) for i in new]
+
+        if self.changes is not None:
+            kept = np.zeros(len(merged), dtype=bool)
+            kept[keep] = True
+            self.changes.extend(('remove', merged[i])
+                                for i in np.flatnonzero(~kept[:len(self)]))
+            self.changes.extend(('insert', merged[i])
+                                for i in keep[keep >= len(self)])
+
+        self._x = x[keep]
+        self._y = y[keep]
+        self._points = [merged[i] for i in keep]
+        self.version += 1
+
+        return inserted
+
+    def _add_each(self, points):
+        # add_many by add, the removed tuples are kept alive in before so
+        # that their ids are not reused by the inserted ones
+        before = self._points[:]
+        ids = set(map(id, before))
+
+        for p in points:
+            self.add(p)
+
+        return sum(id(p) not in ids for p in self._points)
+
+    def _stored(self, p):
+        if self.store_joints or len(p) < 4 or p[3] is None:
+            return p
+
+        return p[0:3] + (None,) + p[4:]
+
+    def _insert(self, p):
+        p = self._stored(p)
+        idx = np.searchsorted(self._x, p[0], side='right')
+
+        self._x = np.insert(self._x, idx, p[0])
+        self._y = np.insert(self._y, idx, p[1])
+        self._points.insert(idx, p)
+        self.version += 1
+
+        if self.changes is not None:
+            self.changes.append(('insert', p))
+
+    def _remove(self, start, end):
+        if start >= end:
+            return
+
+        self._x = np.delete(self._x, np.s_[start:end])
+        self._y = np.delete(self._y, np.s_[start:end])
+
+        if self.changes is not None:
+            self.changes.extend(('remove', p)
+                                for p in self._points[start:end])
+
+        del self._points[start:end]
+        self.version += 1
+
     def is_pareto(self, p):
         """Check if tuple is pareto maximal in first two indices.
 
@@ -57,19 +255,18 @@ class ParetoSet(SortedKeyList):
             return True
 
         # check right for dominating points
-        idx = self.bisect_left(p)
+        idx = np.searchsorted(self._x, p[0])
 
         if idx == len(self):
             return True
         else:
-            return p[1] - self[idx][1] > self.tol
+            return p[1] - self._y[idx] > self.tol
 
     def __contains__(self, p):
-        p_test = (p[0] - self.tol, None)
-        left = self.bisect_left(p_test)
+        left = np.searchsorted(self._x, p[0] - self.tol)
 
-        while left < len(self) and np.abs(self[left][0] - p[0]) < self.tol:
-            if np.abs(self[left][1] - p[1]) < self.tol:
+        while left < len(self) and np.abs(self._x[left] - p[0]) < self.tol:
+            if np.abs(self._y[left] - p[1]) < self.tol:
                 return True
 
             left += 1
@@ -86,12 +283,58 @@ class ParetoSet(SortedKeyList):
             ParetoSet: self
 
         """
-
-        for item in other:
-            self.add(item)
+        self.add_many(other)
 
         return self
 
+    def classify(self, points):
+        """Classify a block of points against the set.
+
+        Args:
+            points (numpy.ndarray): array of shape (N, 2)
+
+        Returns:
+            numpy.ndarray: class of each point, DOMINATED if not pareto
+                maximal, FRONTIER if already in the set and NEW otherwise
+            numpy.ndarray: distance of each point to the pareto frontier
+
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        X, Y = points[:, 0], points[:, 1]
+
+        status, right = self._classify(X, Y)
+        dist = self._staircase_distance(X, Y, right,
+                                        status == self.DOMINATED)
+
+        return status, dist
+
+    def _classify(self, X, Y):
+        status = np.full(len(X), self.NEW, dtype=np.int8)
+        right = np.searchsorted(self._x, X)
+
+        if len(self) == 0:
+            return status, right
+
+        # points of the set within tol in the first index
+        lo = np.searchsorted(self._x, X - self.tol)
+        hi = np.searchsorted(self._x, X + self.tol)
+
+        contained = np.zeros(len(X), dtype=bool)
+        for offset in range(np.max(hi - lo, initial=0)):
+            idx = np.minimum(lo + offset, len(self) - 1)
+            contained |= (lo + offset < hi) & \
+                (np.abs(self._x[idx] - X) < self.tol) & \
+                (np.abs(self._y[idx] - Y) < self.tol)
+
+        # first point on the right dominates unless p is higher
+        dominated = ~contained & (right < len(self)) & \
+            (Y - self._y[np.minimum(right, len(self) - 1)] <= self.tol)
+
+        status[contained] = self.FRONTIER
+        status[dominated] = self.DOMINATED
+
+        return status, right
+
     def distance(self, p):
         """Given a tuple, calculate the minimum Euclidean distance to Pareto
         frontier (in first two indices).
@@ -103,28 +346,182 @@ class ParetoSet(SortedKeyList):
             float: minimum Euclidean distance to pareto frontier
 
         """
-        point = np.array(p[0:2])
+        return self.distances(np.array([p[0:2]]))[0]
+
+    def distances(self, points):
+        """Given an array of points, calculate the minimum Euclidean distance
+        of each to Pareto frontier (in first two indices).
+
+        Args:
+            points (numpy.ndarray): array of shape (N, 2)
+
+        Returns:
+            numpy.ndarray: minimum Euclidean distances to pareto frontier
+
+        """
+        return self.classify(points)[1]
+
+    def gaps(self, points):
+        """Given an array of points, calculate the length of the frontier
+        segment spanning the first index of each, between the nearest points
+        of the set on either side.
+
+        Args:
+            points (numpy.ndarray): array of shape (N, 2)
+
+        Returns:
+            numpy.ndarray: Euclidean distance between the neighbours of each
+                point in the set, inf outside the range of the set
+
+        """
+        X = np.asarray(points, dtype=float).reshape(-1, 2)[:, 0]
+        idx = np.searchsorted(self._x, X)
+
+        gap = np.full(len(X), np.inf)
+        inner = np.flatnonzero((idx > 0) & (idx < len(self)))
+        right = idx[inner]
+        gap[inner] = np.hypot(self._x[right] - self._x[right - 1],
+                              self._y[right] - self._y[right - 1])
+
+        return gap
+
+    def hypervolume(self, ref):
+        """Area dominated by the set (in first two indices) above a reference
+        point.
+
+        Args:
+            ref (tuple): reference point, dominated by every point of the set
+
+        Returns:
+            float: area of the union of the boxes between ref and each point
+
+        """
+        x = np.r_[ref[0], self._x]
+
+        return float(np.sum(np.diff(x) * (self._y - ref[1])))
+
+    def _staircase_distance(self, X, Y, right, dominated):
+        dist = np.zeros(len(X))
+
         # distance is zero if pareto optimal
-        if self.is_pareto(p):
-            return 0.
-
-        # compare with next point
-        idx = self.bisect_left(p)
-        min_dist = self[idx][1] - point[1]
-
-        while self[idx][0] - point[0] < min_dist:
-            if idx + 1 < len(self) and self[idx][1] > point[1]:
-                corner = np.array([self[idx][0], self[idx + 1][1]])
-                dist = np.sqrt(np.sum(np.square(point - corner)))
-                min_dist = np.minimum(dist, min_dist)
-            else:
-                dist = self[idx][0] - point[0]
-                min_dist = np.minimum(dist, min_dist)
-                break
+        q = np.flatnonzero(dominated)
+        if q.size == 0:
+            return dist
+
+        X, Y, idx = X[q], Y[q], right[q]
+
+        # walk right from the next point up to the first point that is not
+        # higher, or the last point, stepping out horizontally there
+        last = np.clip(np.searchsorted(-self._y, -Y), idx, len(self) - 1)
+        d = np.minimum(self._y[idx] - Y, self._x[last] - X)
+
+        # corners between consecutive points along the walk
+        steps = last - idx
+        walking = np.flatnonzero(steps)
+        if walking.size:
+            steps = steps[walking]
+            start = np.cumsum(steps) - steps
+            corner = np.repeat(idx[walking] - start, steps) + \
+                np.arange(np.sum(steps))
+            owner = np.repeat(walking, steps)
+
+            corner_dist = np.sqrt(np.square(X[owner] - self._x[corner]) +
+                                  np.square(Y[owner] - self._y[corner + 1]))
+            d[walking] = np.minimum(d[walking],
+                                    np.minimum.reduceat(corner_dist, start))
 
-            idx += 1
+        dist[q] = d
 
-        return min_dist
+        return dist
+
+    def get_joint(self, idx):
+        """Joint of a (-H, I, labels, joint) point, rebuilt from its labels
+        by self.joint if it is not stored.
+
+        Args:
+            idx (int): index of the point
+
+        Returns:
+            numpy.ndarray or scipy.sparse matrix: joint of the clustering
+
+        """
+        point = self._points[idx]
+        if point[3] is not None:
+            return point[3]
+
+        if self.joint is None:
+            raise ValueError("joint of the point is not stored, set "
+                             "ParetoSet.joint to rebuild it")
+
+        return self.joint(point[2])
+
+    def save(self, file):
+        """Write the coordinates and labels of the points to a .npz file,
+        without their joints.
+
+        Args:
+            file (str or file): file, '.npz' is appended to a str without it
+
+        Returns:
+            None
+
+        """
+        arrays = {'coords': self.to_array(), 'tol': np.array(self.tol)}
+        if len(self) > 0 and len(self._points[0]) > 2:
+            arrays['labels'] = np.array([x[2] for x in self._points])
+
+        np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, file, joint=None):
+        """Read a set written by save. Points are (-H, I, labels, None)
+        tuples, or (-H, I) tuples if no labels were saved. Coordinates are
+        read at once, while the labels of a set loaded from a path are only
+        read when its points are first accessed.
+
+        Args:
+            file (str or file): file written by save
+            joint (callable, optional): joint(labels) rebuilding the joint of
+                a clustering, e.g. partial(joint_from_labels, p), see
+                get_joint
+
+        Returns:
+            ParetoSet: loaded set
+
+        """
+        with np.load(file) as archive:
+            pset = cls(tol=float(archive['tol']))
+            coords = archive['coords']
+            has_labels = 'labels' in archive.files
+
+            if has_labels and not isinstance(file, (str, os.PathLike)):
+                points = _unstack(coords, archive['labels'])
+
+        pset.joint = joint
+        pset._x = np.ascontiguousarray(coords[:, 0])
+        pset._y = np.ascontiguousarray(coords[:, 1])
+
+        if not has_labels:
+            pset._points = [tuple(x) for x in coords.tolist()]
+        elif isinstance(file, (str, os.PathLike)):
+            pset._pending = partial(_read_points, file, coords)
+        else:
+            pset._points = points
+
+        return pset
+
+    def hull(self):
+        """Points of the set on the upper convex hull of the frontier, see
+        upper_hull.
+
+        Args:
+            None
+
+        Returns:
+            numpy.ndarray: indices of the points on the hull, increasing
+
+        """
+        return upper_hull(self.to_array())
 
     def to_array(self):
         """Convert first two indices to numpy.ndarray
@@ -136,11 +533,7 @@ class ParetoSet(SortedKeyList):
             numpy.ndarray: array of shape (len(self), 2)
 
         """
-        A = np.zeros((len(self), 2))
-        for i, tup in enumerate(self):
-            A[i, :] = tup[0:2]
-
-        return A
+        return np.stack((self._x, self._y), axis=1)
 
     def from_list(self, A):
         """Convert iterable of tuples into ParetoSet.
@@ -152,8 +545,7 @@ class ParetoSet(SortedKeyList):
             None
 
         """
-        for a in A:
-            self.add(a)
+        self.add_many(A)
 
     def to_list(self, idx=None):
         """Converts self or slice of self to list.
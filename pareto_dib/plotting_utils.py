@@ -1,10 +1,12 @@
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 from pareto_dib import pareto_mapper
 
 
-def pareto_plot(pset, scale='standard'):
+def pareto_plot(pset, scale='standard', ax=None):
     """
     Plot ParetoSet with boundary lines and convex hull.
 
@@ -12,9 +14,15 @@ def pareto_plot(pset, scale='standard'):
                 pset (ParetoSet): Pareto set
                 scale: 'standard' or 'symmetric' for ParetoMapper and
                     SymmetricParetoMapper output respectively
+                ax (matplotlib.axes.Axes, optional): axes to plot on, default
+                    None plots on a new pyplot figure
+
+        Returns:
+                ax (matplotlib.axes.Axes): axes of the plot
     """
-    fig = plt.figure()
-    ax = fig.gca()
+    if ax is None:
+        fig = plt.figure()
+        ax = fig.gca()
 
     # scale
     if scale == 'standard':
@@ -22,11 +30,11 @@ def pareto_plot(pset, scale='standard'):
     elif scale == 'symmetric':
         sval = 2
     else:
-        raise f"scale: {scale} not supported."
+        raise ValueError(f"scale: {scale} not supported.")
 
     # plot frontier
-    plist = pset.to_list()
-    points = np.array([(x[0] / sval, x[1]) for x in plist])
+    points = pset.to_array()
+    points[:, 0] /= sval
     ax.plot(points[:, 0],
             points[:, 1],
             color='k',
@@ -60,20 +68,7 @@ def pareto_plot(pset, scale='standard'):
                     zorder=1)
 
     # plot hull
-    hull_idx = [0, ]
-    while hull_idx[-1] < points.shape[0] - 1:
-        curr_idx = hull_idx[-1]
-        # find max slope
-        max_slope = None
-        msidx = None
-        for idx in range(curr_idx + 1, points.shape[0]):
-            tslope = (points[curr_idx, 1] - points[idx, 1]) / \
-                (points[curr_idx, 0] - points[idx, 0])
-            if max_slope is None or tslope > max_slope:
-                max_slope = tslope
-                msidx = idx
-
-        hull_idx.append(msidx)
+    hull_idx = pset.hull()
 
     ax.fill_between(points[hull_idx, 0],
                     np.zeros(points[hull_idx, 0].shape),
@@ -93,12 +88,42 @@ def pareto_plot(pset, scale='standard'):
     return ax
 
 
+def save_pareto_plots(psets, files, scale='standard', titles=None, dpi=100):
+    """
+    Render pareto_plot of many sets to image files, without pyplot or a
+    display, on Agg canvases that are released after each file.
+
+        Parameters:
+                psets (iterable of ParetoSet): Pareto sets
+                files (iterable of str): output files, the format is given
+                    by the extension
+                scale: 'standard' or 'symmetric', see pareto_plot
+                titles (iterable of str, optional): plot titles, default
+                    None keeps the title of pareto_plot
+                dpi (float, optional): resolution, default 100
+    """
+    psets, files = list(psets), list(files)
+    if len(psets) != len(files):
+        raise ValueError("psets and files must have the same length")
+
+    titles = [None] * len(psets) if titles is None else list(titles)
+
+    for pset, file, title in zip(psets, files, titles):
+        fig = Figure()
+        FigureCanvasAgg(fig)
+
+        ax = pareto_plot(pset, scale=scale, ax=fig.add_subplot())
+        if title is not None:
+            ax.set_title(title)
+
+        fig.savefig(file, dpi=dpi)
+
+
 if __name__ == "__main__":
-    pxy = np.load(
-        "/Users/andrew/Documents/phd/PAPER-pareto/code/release/examples/data/pxy_alpha27.npy")
+    pxy = np.load("examples/data/pxy_alpha27.npy")
 
     pset, _ = pareto_mapper(pxy, epsilon=1e-12)
 
     pareto_plot(pset)
 
-    plt.plot()
+    plt.show()
@@ -0,0 +1,1119 @@
+import heapq
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from time import perf_counter, time
+
+import numpy as np
+import scipy.sparse as sp
+
+from .classification_utils import canonical_labels, merge_labels
+from .pareto_set import ParetoSet
+
+
+class SearchQueue:
+    """LIFO queue of (-H, I, labels, joint) points with a memory budget.
+
+    When the stored joints exceed the budget, the joints of the coldest
+    points (the bottom of the stack) are dropped and only their labels are
+    kept. A dropped joint is rebuilt from the labels when its point is
+    popped.
+    """
+
+    def __init__(self, joint, max_bytes=None):
+        """
+        Args:
+            joint (callable): joint(labels) returns the joint of a clustering
+            max_bytes (int, optional): memory budget of the queue in bytes,
+                if None the queue is unbounded
+
+        """
+        self.joint = joint
+        self.max_bytes = max_bytes
+
+        self.nbytes = 0
+        self.peak_nbytes = 0
+
+        self._points = []
+        self._cold = 0
+
+    def __len__(self):
+        return len(self._points)
+
+    def __iter__(self):
+        """Iterates over stored points, joints of cold points are None."""
+        return iter(self._points)
+
+    def append(self, point):
+        """Push point, dropping cold joints if over the memory budget.
+
+        Args:
+            point (tuple): (-H, I, labels, joint), joint may be None
+
+        Returns:
+            None
+
+        """
+        self._points.append(point)
+        self.nbytes += _nbytes(point)
+
+        if self.max_bytes is not None:
+            while self.nbytes > self.max_bytes and \
+                    self._cold < len(self._points):
+                cold = self._points[self._cold]
+                self.nbytes -= _nbytes(cold)
+                self._points[self._cold] = cold[0:3] + (None,)
+                self.nbytes += _nbytes(self._points[self._cold])
+                self._cold += 1
+
+        self.peak_nbytes = max(self.peak_nbytes, self.nbytes)
+
+    def pop(self):
+        """Pop the last point, rebuilding its joint if it was dropped.
+
+        Returns:
+            tuple: (-H, I, labels, joint)
+
+        """
+        point = self._points.pop()
+        self.nbytes -= _nbytes(point)
+        self._cold = min(self._cold, len(self._points))
+
+        if point[3] is None:
+            point = point[0:3] + (self.joint(point[2]),)
+
+        return point
+
+    def top(self, k, rebuild=True):
+        """Last k points without popping them, rebuilding dropped joints.
+
+        Args:
+            k (int): number of points
+            rebuild (bool, optional): if False, joints of cold points are
+                left None, default True
+
+        Returns:
+            list: up to k points, the last one is popped next
+
+        """
+        return [x if x[3] is not None or not rebuild else
+                x[0:3] + (self.joint(x[2]),) for x in self._points[-k:]]
+
+
+class PrioritySearchQueue(SearchQueue):
+    """Queue of (-H, I, labels, joint) points popped in order of priority.
+
+    Priorities are computed when a point is pushed and go stale as the
+    frontier changes. They are refreshed lazily: a popped point with a stale
+    priority is re-prioritized and pushed back if it is no longer first,
+    which pops points in order as long as priorities only grow as the state
+    changes. Ties are popped last in, first out. Over the memory budget,
+    joints are dropped from the leaves of the heap, which hold the points
+    popped last.
+    """
+
+    def __init__(self, joint, priority, version, max_bytes=None):
+        """
+        Args:
+            joint (callable): joint(labels) returns the joint of a clustering
+            priority (callable): priority(point) returns the priority of a
+                point, lowest first
+            version (callable): version() returns the version of the state
+                the priorities depend on
+            max_bytes (int, optional): memory budget of the queue in bytes,
+                if None the queue is unbounded
+
+        """
+        super().__init__(joint, max_bytes)
+
+        self.priority = priority
+        self.version = version
+
+        # heap of [priority, tie breaker, version, point] entries
+        self._count = 0
+
+    def __iter__(self):
+        return (entry[3] for entry in self._points)
+
+    def append(self, point):
+        """Push point with its current priority, dropping joints of the
+        leaves of the heap if over the memory budget.
+
+        Args:
+            point (tuple): (-H, I, labels, joint), joint may be None
+
+        Returns:
+            None
+
+        """
+        self._count += 1
+        heapq.heappush(self._points, [self.priority(point), -self._count,
+                                      self.version(), point])
+        self.nbytes += _nbytes(point)
+
+        if self.max_bytes is not None:
+            leaf = len(self._points) - 1
+            while self.nbytes > self.max_bytes and leaf >= 0:
+                entry = self._points[leaf]
+                if entry[3][3] is not None:
+                    self.nbytes -= _nbytes(entry[3])
+                    entry[3] = entry[3][0:3] + (None,)
+                    self.nbytes += _nbytes(entry[3])
+                leaf -= 1
+
+        self.peak_nbytes = max(self.peak_nbytes, self.nbytes)
+
+    def pop(self):
+        """Pop the first point, rebuilding its joint if it was dropped.
+
+        Returns:
+            tuple: (-H, I, labels, joint)
+
+        """
+        while True:
+            entry = heapq.heappop(self._points)
+            if entry[2] == self.version() or not self._points:
+                break
+
+            entry[0], entry[2] = self.priority(entry[3]), self.version()
+            if entry[0:2] <= self._points[0][0:2]:
+                break
+            heapq.heappush(self._points, entry)
+
+        point = entry[3]
+        self.nbytes -= _nbytes(point)
+
+        if point[3] is None:
+            point = point[0:3] + (self.joint(point[2]),)
+
+        return point
+
+    def top(self, k, rebuild=True):
+        """First k points by their current priorities without popping them,
+        rebuilding dropped joints.
+
+        Args:
+            k (int): number of points
+            rebuild (bool, optional): if False, joints of cold points are
+                left None, default True
+
+        Returns:
+            list: up to k points, the last one is likely popped next
+
+        """
+        return [x if x[3] is not None or not rebuild else
+                x[0:3] + (self.joint(x[2]),)
+                for *_, x in reversed(heapq.nsmallest(k, self._points))]
+
+
+class KeySet:
+    """Set of fixed size hash keys, stored as bytes in a Python set.
+
+    Keys are digests of digest_size bytes, written to checkpoints as an
+    array of digest_size / 8 words per key.
+    """
+
+    def __init__(self, digest_size=8):
+        """
+        Args:
+            digest_size (int, optional): bytes per key, a multiple of 8
+
+        """
+        self.digest_size = digest_size
+
+        self._keys = set()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def add(self, key):
+        """Insert a key.
+
+        Args:
+            key (bytes): digest of digest_size bytes
+
+        Returns:
+            bool: True if the key was not in the set
+
+        """
+        size = len(self._keys)
+        self._keys.add(key)
+
+        return len(self._keys) > size
+
+    def to_array(self):
+        """Stored keys as an array of shape (len(self), digest_size / 8)"""
+        keys = np.frombuffer(b''.join(sorted(self._keys)), dtype=np.uint64)
+
+        return keys.reshape(-1, self.digest_size // 8)
+
+    @classmethod
+    def from_array(cls, keys):
+        """Inverse of to_array"""
+        keys = np.ascontiguousarray(keys, dtype=np.uint64)
+
+        ret = cls(8 * keys.shape[1])
+        ret._keys.update(words.tobytes() for words in keys)
+
+        return ret
+
+
+class SearchProfile:
+    """Wall time per phase of a search and counts of search events.
+
+    Time is measured in laps, lap(phase) charges the time since the previous
+    lap to phase, so that the phases partition the search time.
+    """
+
+    PHASES = ('evaluate', 'merge', 'labels', 'dedup', 'pareto', 'queue',
+              'checkpoint', 'other')
+
+    # children generated, inserted as Pareto optimal, kept by the epsilon
+    # draw only, skipped as already tried and pushed to the queue
+    EVENTS = ('children', 'pareto', 'epsilon', 'deduped', 'queued')
+
+    def __init__(self):
+        self.times = dict.fromkeys(self.PHASES, 0.)
+        self.counts = dict.fromkeys(self.EVENTS, 0)
+        self.queue_depth = []
+
+        self._t = perf_counter()
+
+    def lap(self, phase):
+        t = perf_counter()
+        self.times[phase] += t - self._t
+        self._t = t
+
+    def count(self, event, k=1):
+        self.counts[event] += k
+
+    def sample(self, depth):
+        self.queue_depth.append(depth)
+
+    def to_dict(self):
+        """Times in seconds, event counts and the queue depth before each
+        searched point"""
+        return {'times': dict(self.times),
+                'counts': dict(self.counts),
+                'queue_depth': self.queue_depth}
+
+
+class _NoProfile:
+    """SearchProfile that records nothing."""
+
+    def lap(self, phase):
+        pass
+
+    def count(self, event, k=1):
+        pass
+
+    def sample(self, depth):
+        pass
+
+
+_NO_PROFILE = _NoProfile()
+
+
+def partition_key(labels, digest_size=8):
+    """Digest of the canonical labels of a partition, the same for every
+    labelling of the partition.
+
+    Args:
+        labels (numpy.ndarray): cluster of each element
+        digest_size (int, optional): bytes of the key, 8 or 16 for 64 or 128
+            bits
+
+    Returns:
+        bytes: blake2b digest
+
+    """
+    return blake2b(canonical_labels(labels).tobytes(),
+                   digest_size=digest_size).digest()
+
+
+def _nbytes(point):
+    joint = point[3]
+    if joint is None:
+        return point[2].nbytes
+    elif sp.issparse(joint):
+        return point[2].nbytes + joint.data.nbytes + \
+            joint.indices.nbytes + joint.indptr.nbytes
+
+    return point[2].nbytes + joint.nbytes
+
+
+def greedy_sweeps(root, evaluate, merge, sweeps, rng, choices=3):
+    """Agglomerative sweeps from root down to a single cluster, merging the
+    pair losing the least I per H gained at each step. The first sweep is
+    greedy, the others merge a pair drawn among the choices best.
+
+    Args:
+        root (tuple): (-H, I, labels, joint) starting point
+        evaluate (callable): see pareto_search
+        merge (callable): see pareto_search
+        sweeps (int): number of sweeps
+        rng (numpy.random.Generator): source of the randomized merges
+        choices (int, optional): number of best pairs drawn from
+
+    Returns:
+        list: (-H, I, labels, joint) points along the sweeps
+        int: number of points evaluated
+
+    """
+    points = []
+    count = 0
+
+    for sweep in range(sweeps):
+        point = root
+
+        while True:
+            Hc, Ic = evaluate(point[0], point[1], point[3], point[2])
+            count += 1
+
+            m = Hc.shape[0]
+            if m < 2:
+                break
+
+            J, K = np.triu_indices(m, 1)
+            dH, dI = Hc[J, K] - point[0], point[1] - Ic[J, K]
+
+            # merges of clusters without mass are free
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = np.where(dH > 0, dI / dH, np.where(dI > 0, np.inf,
+                                                           0.))
+
+            if sweep == 0:
+                i = np.argmin(ratio)
+            else:
+                i = rng.choice(np.argsort(ratio, kind='stable')[:choices])
+
+            j, k = J[i], K[i]
+            point = (Hc[j, k], Ic[j, k], merge_labels(point[2], j, k, m),
+                     merge(point[3], j, k))
+            points.append(point)
+
+    return points, count
+
+
+def pareto_search(root, evaluate, merge, epsilon, rng, workers=None,
+                  test_parent=False, joint=None, checkpoint=None,
+                  checkpoint_interval=600., resume_from=None,
+                  max_queue_memory=None, dedup='partition',
+                  profile=False, order='lifo', warm_start=None,
+                  store_joints=True):
+    """
+    Epsilon search over pairwise cluster merges, shared by the mappers.
+    Runs iter_pareto_search to completion.
+
+        Parameters:
+                root (tuple): (-H, I, labels, joint) starting point
+                evaluate (callable): evaluate(-H, I, joint, labels) returns
+                    (m, m) upper triangular arrays of the -H and I of each
+                    merge
+                merge (callable): merge(joint, j, k) returns the joint with
+                    clusters j and k merged
+                epsilon (float): search depth
+                rng (numpy.random.Generator): source of the acceptance draws
+                workers (int, optional): number of processes evaluating
+                    queued points, default None evaluates in this process
+                test_parent (bool, optional): if True, children are kept
+                    according to whether their parent is still Pareto optimal
+                    (and inserted), instead of their own distance to the
+                    frontier
+                joint (callable, optional): joint(labels) returns the joint
+                    of a clustering, required to bound the queue memory,
+                    checkpoint or resume
+                checkpoint (str, optional): path of the checkpoint file
+                checkpoint_interval (float, optional): seconds between
+                    checkpoints, default 600
+                resume_from (str, optional): checkpoint to resume from
+                max_queue_memory (int, optional): memory budget of the queue
+                    in bytes, see SearchQueue, which does not count the
+                    joints and merge costs of the up to 2 workers points
+                    evaluated ahead of time by the pool
+                dedup (str, optional): 'partition' to search each partition
+                    once, keyed by partition_key, or 'coordinates' to search
+                    each (-H, I) rounded to 8 decimals once
+                profile (bool, optional): if True, stats['profile'] holds
+                    SearchProfile.to_dict of the search, with workers the
+                    evaluate phase is the wait for results of the pool
+                order (str, optional): 'lifo' searches the last queued point
+                    first, 'best' searches the queued point closest to the
+                    frontier and in the widest frontier gap first, see
+                    PrioritySearchQueue, which covers the whole frontier
+                    sooner in a search stopped early
+                warm_start (int, optional): number of greedy_sweeps whose
+                    points seed the frontier and the queue before the search,
+                    so that children are pruned against a good frontier from
+                    the start, default None seeds nothing, unused when
+                    resuming
+                store_joints (bool, optional): if False, frontier points
+                    are stored as (-H, I, labels, None), see ParetoSet,
+                    default True
+
+        Returns:
+                pset (ParetoSet): Pareto frontier
+                stats (dict): search statistics
+    """
+    for kind, data in iter_pareto_search(
+            root, evaluate, merge, epsilon, rng, workers=workers,
+            test_parent=test_parent, joint=joint, checkpoint=checkpoint,
+            checkpoint_interval=checkpoint_interval,
+            resume_from=resume_from, max_queue_memory=max_queue_memory,
+            dedup=dedup, profile=profile, order=order,
+            warm_start=warm_start, store_joints=store_joints):
+        pass
+
+    return data
+
+
+def iter_pareto_search(root, evaluate, merge, epsilon, rng, workers=None,
+                       test_parent=False, joint=None, checkpoint=None,
+                       checkpoint_interval=600., resume_from=None,
+                       max_queue_memory=None, dedup='partition',
+                       profile=False, max_time=None, max_nodes=None,
+                       max_stable=None, stats_interval=None,
+                       order='lifo', warm_start=None, store_joints=True):
+    """
+    Generator form of pareto_search, yielding the changes of the frontier
+    as the search proceeds and stopping early under a budget.
+
+        Parameters:
+                root, evaluate, merge, epsilon, rng, workers, test_parent,
+                joint, checkpoint, checkpoint_interval, resume_from,
+                max_queue_memory, dedup, profile, order, warm_start,
+                store_joints: see pareto_search
+                max_time (float, optional): seconds after which the search
+                    stops, default None is unbounded
+                max_nodes (int, optional): number of searched points after
+                    which the search stops, default None is unbounded
+                max_stable (int, optional): number of consecutive searched
+                    points leaving the frontier unchanged after which the
+                    search stops, default None is unbounded
+                stats_interval (float, optional): seconds between stats
+                    events, default None yields none
+
+        Yields:
+                ('insert', point) and ('remove', point) as the frontier
+                    changes, including the frontier of a resumed search
+                ('stats', stats) snapshots of the search statistics
+                ('done', (pset, stats)) last, where stats['stopped'] is the
+                    budget that stopped the search, or None if it completed,
+                    a stopped search is checkpointed if checkpoint is given
+    """
+    if dedup not in ('partition', 'coordinates'):
+        raise ValueError("dedup must be 'partition' or 'coordinates'")
+    if order not in ('lifo', 'best'):
+        raise ValueError("order must be 'lifo' or 'best'")
+
+    queued, tried, pset, count, t0, warm_count = _initial_state(
+        root, evaluate, merge, rng, dedup, joint, resume_from, warm_start,
+        store_joints)
+
+    Q = _search_queue(order, joint, pset, max_queue_memory)
+    for point in queued:
+        Q.append(point)
+
+    tc = ts = t_start = time()
+    prof = SearchProfile() if profile else _NO_PROFILE
+
+    pset.changes = [('insert', p) for p in pset]
+    count_start = count
+    stable = 0
+    stopped = None
+
+    # the queue is evaluated ahead of time by the pool, while insertion into
+    # pset and tried stays in this process in serial order
+    pool = ProcessPoolExecutor(workers) if workers and workers > 1 else None
+    pending = {}
+
+    try:
+        while Q:
+            stopped = _budget_exceeded(count - count_start, time() - t_start,
+                                       stable, max_nodes, max_time,
+                                       max_stable)
+            if stopped is not None:
+                break
+
+            if checkpoint is not None and _due(checkpoint_interval, tc):
+                _checkpoint(checkpoint, Q, tried, pset, root, rng, count, t0)
+                tc = time()
+                prof.lap('checkpoint')
+
+            count += 1
+            prof.sample(len(Q))
+
+            point, (Hc, Ic) = _pop_evaluated(Q, evaluate, pool, pending,
+                                             2 * (workers or 0), prof)
+            node_version = pset.version
+
+            _expand(point, Hc, Ic, pset, Q, tried, merge, epsilon, rng,
+                    test_parent, dedup, prof)
+
+            stable = stable + 1 if pset.version == node_version else 0
+
+            yield from _pop_changes(pset)
+
+            if _due(stats_interval, ts):
+                yield 'stats', _search_stats(count, t0, len(Q), pset,
+                                             Q.peak_nbytes)
+                ts = time()
+            prof.lap('other')
+
+        if stopped is not None and checkpoint is not None:
+            _checkpoint(checkpoint, Q, tried, pset, root, rng, count, t0)
+    finally:
+        if pool is not None:
+            for future in pending.values():
+                future.cancel()
+            pool.shutdown()
+
+    tf = time()
+
+    stats = {}
+    stats['searched'] = count
+    stats['time'] = float(tf - t0)
+    stats['resumed_from'] = resume_from
+    stats['warm_start_searched'] = warm_count
+    stats['peak_queue_memory'] = Q.peak_nbytes
+    stats['profile'] = prof.to_dict() if profile else None
+    stats['stopped'] = stopped
+
+    yield from _pop_changes(pset, journal=False)
+    yield 'done', (pset, stats)
+
+
+def _initial_state(root, evaluate, merge, rng, dedup, joint, resume_from,
+                   warm_start, store_joints):
+    # queue, tried keys, frontier, searched count, start time and warm start
+    # evaluations of a new or resumed search
+    if resume_from is not None:
+        queued, tried, pset, meta = load_checkpoint(resume_from, joint,
+                                                    store_joints)
+        rng.bit_generator.state = meta['rng_state']
+
+        return queued, tried, pset, meta['searched'], \
+            time() - meta['time'], 0
+
+    pset = ParetoSet(store_joints=store_joints)
+    tried = KeySet() if dedup == 'partition' else set()
+    queued = []
+    warm_count = 0
+
+    if warm_start:
+        # seeds are inserted and queued like accepted children, so that the
+        # search also expands the frontier around them
+        seeds, warm_count = greedy_sweeps(root, evaluate, merge, warm_start,
+                                          rng)
+        pset.add_many(seeds)
+
+        for seed in seeds:
+            if dedup == 'partition':
+                pid = partition_key(seed[2])
+            else:
+                pid = (round(seed[0], 8), round(seed[1], 8))
+
+            if pid not in tried:
+                tried.add(pid)
+                queued.append(seed)
+
+    # the root is searched first
+    return queued + [root], tried, pset, 0, time(), warm_count
+
+
+def _search_queue(order, joint, pset, max_queue_memory):
+    # SearchQueue of the search order, prioritized against pset if 'best'
+    if order == 'lifo':
+        return SearchQueue(joint, max_queue_memory)
+
+    def priority(point):
+        xy = np.array([point[0:2]])
+        return float(pset.distances(xy)[0] - pset.gaps(xy)[0])
+
+    return PrioritySearchQueue(joint, priority, lambda: pset.version,
+                               max_queue_memory)
+
+
+def _budget_exceeded(searched, elapsed, stable, max_nodes, max_time,
+                     max_stable):
+    # name of the first budget of the search that is used up, or None
+    if max_nodes is not None and searched >= max_nodes:
+        return 'max_nodes'
+    elif max_time is not None and elapsed >= max_time:
+        return 'max_time'
+    elif max_stable is not None and stable >= max_stable:
+        return 'max_stable'
+
+    return None
+
+
+def _due(interval, last):
+    # True if interval seconds have passed since last, never if None
+    return interval is not None and time() - last >= interval
+
+
+def _pop_changes(pset, journal=True):
+    # frontier changes since the last call, the journal is only restarted if
+    # journal is True
+    changes, pset.changes = pset.changes, [] if journal else None
+
+    return changes
+
+
+def _search_stats(count, t0, queued, pset, peak_nbytes):
+    # payload of a stats event
+    return {'searched': count,
+            'time': float(time() - t0),
+            'queued': queued,
+            'pareto_size': len(pset),
+            'peak_queue_memory': peak_nbytes}
+
+
+def _checkpoint(path, Q, tried, pset, root, rng, count, t0):
+    save_checkpoint(path, Q, tried, pset, root[2],
+                    {'rng_state': rng.bit_generator.state,
+                     'searched': count,
+                     'time': time() - t0})
+
+
+def _pop_evaluated(Q, evaluate, pool, pending, prefetch, prof):
+    # next point of Q and its merge costs, with the next prefetch points of
+    # Q submitted to the pool if any; pending holds at most prefetch
+    # futures, those of points pushed down the queue are cancelled unless
+    # already started, and kept until popped otherwise
+    if pool is not None:
+        # keyed by the labels array, which outlives rebuilt joints
+        top = Q.top(prefetch, rebuild=False)
+        keep = set(id(queued[2]) for queued in top)
+        for key in [key for key in pending if key not in keep]:
+            if pending[key].cancel():
+                del pending[key]
+
+        for queued in reversed(top):
+            if len(pending) >= prefetch:
+                break
+            elif id(queued[2]) in pending:
+                continue
+            pc = queued[3] if queued[3] is not None else Q.joint(queued[2])
+            pending[id(queued[2])] = pool.submit(
+                evaluate, queued[0], queued[1], pc, queued[2])
+
+    point = Q.pop()
+    prof.lap('queue')
+
+    # a re-prioritized point may not have been submitted
+    future = pending.pop(id(point[2]), None)
+    if future is not None:
+        costs = future.result()
+    else:
+        costs = evaluate(point[0], point[1], point[3], point[2])
+    prof.lap('evaluate')
+
+    return point, costs
+
+
+def _expand(point, Hc, Ic, pset, Q, tried, merge, epsilon, rng, test_parent,
+            dedup, prof):
+    # inserts the Pareto optimal children of point into pset and queues the
+    # children kept by their acceptance draw, see pareto_search
+    _, _, labels, pc = point
+    m = Hc.shape[0]
+
+    # one acceptance draw per candidate merge
+    J, K = np.triu_indices(m, 1)
+    R = rng.random(len(J))
+    prof.count('children', len(J))
+    prof.lap('other')
+
+    # classify all candidates at once, the frontier only grows while
+    # siblings are inserted so candidates that are dominated and fail
+    # their draw now would also fail it later
+    X, Y = Hc[J, K], Ic[J, K]
+    status, dist = pset.classify(np.stack((X, Y), axis=1))
+    version = pset.version
+    prof.lap('pareto')
+
+    if test_parent:
+        idx = np.arange(len(J))
+    else:
+        idx = np.flatnonzero((status != pset.DOMINATED) |
+                             (np.exp(-dist / epsilon) > R))
+
+    parent_version = None
+
+    for i in idx.tolist():
+        j, k = J[i], K[i]
+        new_point = (X[i], Y[i])
+        child = None
+
+        # re-evaluate against the frontier if siblings changed it
+        if pset.version == version:
+            a = status[i] != pset.DOMINATED
+            d = dist[i]
+        else:
+            a = status[i] != pset.DOMINATED and pset.is_pareto(new_point)
+            d = 0. if a else pset.distance(new_point)
+        prof.lap('pareto')
+
+        if a:
+            child = new_point + (merge_labels(labels, j, k, m),)
+            prof.lap('labels')
+            child += (merge(pc, j, k),)
+            prof.lap('merge')
+            if pset.add(child):
+                prof.count('pareto')
+
+        if test_parent:
+            if pset.version != parent_version:
+                a = pset.add(point)
+                d_parent = pset.distance(point)
+                parent_version = pset.version
+            else:
+                a = False
+
+            d = d_parent
+        prof.lap('pareto')
+
+        b = np.exp(-d / epsilon) > R[i]
+        if b and child is None:
+            prof.count('epsilon')
+        prof.lap('other')
+
+        if a or b:
+            _queue_child(new_point, child, labels, j, k, m, pc, merge, dedup,
+                         tried, Q, prof)
+
+
+def _queue_child(new_point, child, labels, j, k, m, pc, merge, dedup, tried,
+                 Q, prof):
+    # queues the child merging clusters j and k of a point unless it has
+    # been tried, children that are neither kept nor inserted are never
+    # built
+    if dedup == 'partition':
+        if child is None:
+            child_labels = merge_labels(labels, j, k, m)
+            prof.lap('labels')
+        else:
+            child_labels = child[2]
+        pid = partition_key(child_labels)
+    else:
+        child_labels = None
+        pid = (round(new_point[0], 8), round(new_point[1], 8))
+
+    if pid in tried:
+        prof.count('deduped')
+        prof.lap('dedup')
+        return
+
+    prof.lap('dedup')
+    if child is None:
+        if child_labels is None:
+            child_labels = merge_labels(labels, j, k, m)
+            prof.lap('labels')
+        child = new_point + (child_labels, merge(pc, j, k))
+        prof.lap('merge')
+
+    tried.add(pid)
+    prof.lap('dedup')
+    Q.append(child)
+    prof.count('queued')
+    prof.lap('queue')
+
+
+def _fronts(X, Y):
+    # indices of the points by Pareto rank among themselves, one front of
+    # points not dominated by the remaining points at a time
+    remaining = np.lexsort((-Y, -X))
+
+    while remaining.size:
+        y = Y[remaining]
+        front = y > np.r_[-np.inf, np.maximum.accumulate(y)[:-1]]
+
+        yield remaining[front]
+        remaining = remaining[~front]
+
+
+def _ranked(X, Y, dist):
+    # by Pareto rank and by distance to the frontier within a front
+    for front in _fronts(X, Y):
+        yield from front[np.argsort(dist[front], kind='stable')].tolist()
+
+
+def iter_beam_search(root, evaluate, merge, beam_width, dedup='partition',
+                     profile=False, max_time=None, max_nodes=None,
+                     max_stable=None, stats_interval=None,
+                     store_joints=True, test_parent=False):
+    """
+    Beam search over pairwise cluster merges, keeping the beam_width best
+    partitions of each number of clusters m. Every merge of every partition
+    in the beam is evaluated and inserted into the frontier if Pareto
+    optimal, then the merges are ranked by Pareto rank among themselves and
+    by distance to the frontier to form the beam of m - 1 clusters, which
+    takes O(n beam_width m^2) merge evaluations in total.
+
+        Parameters:
+                root, evaluate, merge, dedup, profile, store_joints: see
+                    pareto_search
+                beam_width (int): partitions kept per number of clusters
+                max_time, max_nodes, max_stable, stats_interval: see
+                    iter_pareto_search
+                test_parent (bool, optional): if True, searched partitions
+                    are inserted into the frontier as in pareto_search, which
+                    only adds the root since the others were inserted when
+                    merged if Pareto optimal, so that both searches of a
+                    mapper return the same kind of frontier
+
+        Yields:
+                events of iter_pareto_search
+    """
+    if dedup not in ('partition', 'coordinates'):
+        raise ValueError("dedup must be 'partition' or 'coordinates'")
+    if beam_width < 1:
+        raise ValueError("beam_width must be positive")
+
+    t0 = ts = time()
+    prof = SearchProfile() if profile else _NO_PROFILE
+
+    pset = ParetoSet(store_joints=store_joints)
+    pset.changes = []
+    if test_parent:
+        pset.add(root)
+
+    beam = [root]
+    peak_nbytes = _nbytes(root)
+    count = 0
+    stable = 0
+    stopped = None
+
+    while beam:
+        # candidate merges of the beam, see _beam_candidates
+        level = []
+
+        for b, point in enumerate(beam):
+            stopped = _budget_exceeded(count, time() - t0, stable, max_nodes,
+                                       max_time, max_stable)
+            if stopped is not None:
+                break
+
+            count += 1
+            prof.sample(len(beam) - b)
+            prof.lap('other')
+
+            node_version = pset.version
+            level.append(_beam_candidates(point, evaluate, merge, pset,
+                                          prof))
+            stable = stable + 1 if pset.version == node_version else 0
+
+            yield from _pop_changes(pset)
+
+            if _due(stats_interval, ts):
+                yield 'stats', _search_stats(count, t0, len(beam) - b - 1,
+                                             pset, peak_nbytes)
+                ts = time()
+            prof.lap('other')
+
+        if stopped is not None or not level:
+            break
+
+        beam = _next_beam(beam, level, pset, merge, beam_width, dedup, prof)
+        peak_nbytes = max(peak_nbytes, sum(map(_nbytes, beam)))
+        prof.lap('queue')
+
+    stats = {}
+    stats['searched'] = count
+    stats['time'] = float(time() - t0)
+    stats['resumed_from'] = None
+    stats['peak_queue_memory'] = peak_nbytes
+    stats['profile'] = prof.to_dict() if profile else None
+    stats['stopped'] = stopped
+
+    yield from _pop_changes(pset, journal=False)
+    yield 'done', (pset, stats)
+
+
+def _beam_candidates(point, evaluate, merge, pset, prof):
+    # evaluates every merge of a partition of the beam and inserts those
+    # new to the frontier and not dominated by each other at once, returns
+    # the (-H, I, J, K, m, built) candidates, where built maps the index of
+    # a candidate to its built child
+    Hc, Ic = evaluate(point[0], point[1], point[3], point[2])
+    prof.lap('evaluate')
+
+    _, _, labels, pc = point
+    m = Hc.shape[0]
+
+    J, K = np.triu_indices(m, 1)
+    X, Y = Hc[J, K], Ic[J, K]
+    prof.count('children', len(J))
+
+    status, _ = pset.classify(np.stack((X, Y), axis=1))
+    new = np.flatnonzero(status == pset.NEW)
+    new = new[next(_fronts(X[new], Y[new]), [])]
+    prof.lap('pareto')
+
+    built = {}
+    for i in new.tolist():
+        child_labels = merge_labels(labels, J[i], K[i], m)
+        prof.lap('labels')
+        built[i] = (X[i], Y[i], child_labels, merge(pc, J[i], K[i]))
+        prof.lap('merge')
+
+    prof.count('pareto', pset.add_many(built.values()))
+    prof.lap('pareto')
+
+    return X, Y, J, K, m, built
+
+
+def _next_beam(beam, level, pset, merge, beam_width, dedup, prof):
+    # the beam_width best candidates of the beam by Pareto rank and distance
+    # to the frontier, skipping merges reaching the same partition
+    X = np.concatenate([c[0] for c in level])
+    Y = np.concatenate([c[1] for c in level])
+    parents = np.concatenate([np.full(len(c[0]), b)
+                              for b, c in enumerate(level)])
+
+    # first candidate of each partition in the beam
+    offsets = np.cumsum([0] + [len(c[0]) for c in level])
+
+    dist = pset.distances(np.stack((X, Y), axis=1))
+    prof.lap('pareto')
+
+    tried = set()
+    next_beam = []
+    for i in _ranked(X, Y, dist):
+        if len(next_beam) == beam_width:
+            break
+
+        b = parents[i]
+        point, (_, _, J, K, m, built) = beam[b], level[b]
+        j, k = J[i - offsets[b]], K[i - offsets[b]]
+
+        child = built.get(i - offsets[b])
+        child_labels = child[2] if child is not None else \
+            merge_labels(point[2], j, k, m)
+        prof.lap('labels')
+
+        if dedup == 'partition':
+            pid = partition_key(child_labels)
+        else:
+            pid = (round(X[i], 8), round(Y[i], 8))
+        if pid in tried:
+            prof.count('deduped')
+            prof.lap('dedup')
+            continue
+        tried.add(pid)
+        prof.lap('dedup')
+
+        if child is None:
+            child = (X[i], Y[i], child_labels, merge(point[3], j, k))
+            prof.lap('merge')
+        next_beam.append(child)
+        prof.count('queued')
+
+    return next_beam
+
+
+def save_checkpoint(path, Q, tried, pset, labels0, meta):
+    """Atomically writes the search state to a .npz file. Joints are not
+    saved, they are rebuilt from the labels by load_checkpoint.
+
+    Args:
+        path (str): checkpoint file
+        Q (list): queue of (-H, I, labels, joint) points
+        tried (set or KeySet): rounded coordinates or partition keys of
+            tried points
+        pset (ParetoSet): current frontier
+        labels0 (numpy.ndarray): labels of the starting point
+        meta (dict): JSON serializable run state
+
+    Returns:
+        None
+
+    """
+    def stack(points):
+        coords = np.array([x[0:2] for x in points], dtype=float)
+        labels = np.array([x[2] for x in points], dtype=labels0.dtype)
+
+        return coords.reshape(-1, 2), labels.reshape(-1, len(labels0))
+
+    Q_coords, Q_labels = stack(Q)
+    pset_coords, pset_labels = stack(pset)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        np.savez_compressed(fh,
+                            Q_coords=Q_coords,
+                            Q_labels=Q_labels,
+                            pset_coords=pset_coords,
+                            pset_labels=pset_labels,
+                            tried=_tried_array(tried),
+                            meta=np.array(json.dumps(meta)))
+    os.replace(tmp, path)
+
+
+def _tried_array(tried):
+    if isinstance(tried, KeySet):
+        return tried.to_array()
+
+    return np.array(sorted(tried), dtype=float).reshape(-1, 2)
+
+
+def load_checkpoint(path, joint, store_joints=True):
+    """Reads a search state written by save_checkpoint.
+
+    Args:
+        path (str): checkpoint file
+        joint (callable): joint(labels) returns the joint of a clustering
+        store_joints (bool, optional): if False, the joints of the frontier
+            are not rebuilt, see ParetoSet
+
+    Returns:
+        list: queue, joints are None and rebuilt by SearchQueue.pop
+        set or KeySet: rounded coordinates or partition keys of tried points
+        ParetoSet: frontier
+        dict: run state
+
+    """
+    def unstack(coords, labels, joint):
+        return [(H, I, x, joint(x) if joint is not None else None)
+                for (H, I), x in zip(coords.tolist(), labels)]
+
+    with np.load(path) as data:
+        Q = unstack(data['Q_coords'], data['Q_labels'], None)
+        if data['tried'].dtype == np.uint64:
+            tried = KeySet.from_array(data['tried'])
+        else:
+            tried = {tuple(x) for x in data['tried'].tolist()}
+
+        pset = ParetoSet(store_joints=store_joints)
+        pset.from_list(unstack(data['pset_coords'], data['pset_labels'],
+                               joint if store_joints else None))
+
+        meta = json.loads(str(data['meta']))
+
+    return Q, tried, pset, meta
+
+
+def make_rng(seed=None):
+    """Returns a numpy.random.Generator and the seed that reproduces it.
+
+    Args:
+        seed (int or numpy.random.Generator, optional): seed or generator,
+            if None a fresh seed is drawn
+
+    Returns:
+        numpy.random.Generator: generator
+        int: seed, None if a generator was given
+
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed, None
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    return np.random.default_rng(seed), seed
@@ -0,0 +1,168 @@
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import scipy.sparse as sp
+
+from .jit_utils import get_kernels
+from .pareto_mapper import MergeCostCache, pareto_mapper
+from .symmetric_pareto_mapper import symmetric_pareto_mapper
+
+
+def _json_default(x):
+    # numpy scalars and arrays of run_stats
+    if isinstance(x, np.generic):
+        return x.item()
+    if isinstance(x, np.ndarray):
+        return x.tolist()
+    raise TypeError(f"{type(x).__name__} is not JSON serializable")
+
+
+def _record(name, epsilon, pset, run_stats):
+    return {'dataset': name,
+            'epsilon': epsilon,
+            'frontier': pset.to_array().tolist(),
+            'labels': [point[2].tolist() for point in pset],
+            'run_stats': run_stats}
+
+
+# MergeCostCache of each dataset, by name and backend, shared by the runs
+# of a pool worker process
+_WORKER_CACHES = {}
+
+
+def _mapper(name, p, kind):
+    """Mapper of a dataset, given by kind or by the shape of its joint."""
+    if kind is None:
+        if sp.issparse(p) and \
+                int(np.rint(np.sqrt(p.shape[0]))) ** 2 == p.shape[0]:
+            raise ValueError(f"the mapper of sparse joint '{name}' is "
+                             "ambiguous, a (N N, |Y|) matrix may be "
+                             "p_{X1 X2; Y}, set it in mappers")
+        kind = 'symmetric' if p.ndim == 3 else 'pareto'
+
+    if kind == 'pareto':
+        return pareto_mapper
+    elif kind == 'symmetric':
+        return symmetric_pareto_mapper
+
+    raise ValueError("mappers must be 'pareto' or 'symmetric'")
+
+
+def _sweep_run(name, joint, kind, epsilon, cache_size, kwargs, caches=None):
+    """Runs one epsilon of a dataset, with the merge cost cache of the
+    dataset in caches, or in the caches of the worker process if None."""
+    p = np.load(joint) if isinstance(joint, str) else joint
+    mapper = _mapper(name, p, kind)
+
+    # the symmetric mapper has no cache
+    if mapper is pareto_mapper and cache_size is not None:
+        caches = _WORKER_CACHES if caches is None else caches
+        backend = kwargs.get('backend', 'numpy')
+
+        if (name, backend) not in caches:
+            _, (costs, _, _, _) = get_kernels(backend)
+            caches[name, backend] = MergeCostCache(p.shape[0], cache_size,
+                                                   costs)
+        kwargs = dict(kwargs, cache_size=caches[name, backend])
+
+    pset, run_stats = mapper(p, epsilon=epsilon, **kwargs)
+
+    return _record(name, epsilon, pset, run_stats)
+
+
+def pareto_sweep(joints, epsilons, store=None, workers=None,
+                 cache_size=100000, mappers=None, **kwargs):
+    """
+    Pareto Mapper over several datasets and search depths
+
+        Parameters:
+                joints (dict): joint distributions, or paths of .npy files,
+                    by dataset name
+                epsilons (list of float): search depths run on each dataset
+                store (str, optional): JSON lines file each record is
+                    appended to as its run completes, see load_sweep
+                workers (int, optional): number of processes, each running
+                    one (dataset, epsilon) at a time, default None runs in
+                    this process
+                cache_size (int, optional): number of cluster pairs whose
+                    merge costs are cached and shared by the runs of a
+                    dataset in a process, see MergeCostCache, default
+                    100000, None disables the cache
+                mappers (dict, optional): 'pareto' or 'symmetric' by dataset
+                    name, by default dense 3-D joints p_{X1 X2; Y} are
+                    searched by symmetric_pareto_mapper and other joints by
+                    pareto_mapper, a sparse joint with a square number of
+                    rows must be given one
+                **kwargs: further arguments of the mappers, e.g. seed,
+                    backend or dedup, the mappers run in a single process
+
+        Returns:
+                records (list of dict): by completion, the 'dataset',
+                    'epsilon', 'frontier' (-H, I) coordinates and 'labels' of
+                    the frontier points and the 'run_stats' of each run
+    """
+    mappers = {} if mappers is None else mappers
+
+    # deeper searches first, so that shallower ones mostly hit the cache
+    tasks = [(name, joint, mappers.get(name), epsilon)
+             for epsilon in sorted(epsilons, reverse=True)
+             for name, joint in joints.items()]
+
+    if workers is None:
+        caches = {}
+        results = (_sweep_run(name, joint, kind, epsilon, cache_size, kwargs,
+                              caches)
+                   for name, joint, kind, epsilon in tasks)
+        return _collect(results, store)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_sweep_run, name, joint, kind, epsilon,
+                               cache_size, kwargs)
+                   for name, joint, kind, epsilon in tasks]
+        results = (future.result() for future in as_completed(futures))
+        return _collect(results, store)
+
+
+def _collect(results, store):
+    out = open(store, 'a') if store is not None else None
+
+    records = []
+    try:
+        for record in results:
+            if out is not None:
+                out.write(json.dumps(record, default=_json_default))
+                out.write('\n')
+                out.flush()
+            records.append(record)
+    finally:
+        if out is not None:
+            out.close()
+
+    return records
+
+
+def load_sweep(store):
+    """
+    Reads the records of a sweep store
+
+        Parameters:
+                store (str): JSON lines file written by pareto_sweep
+
+        Returns:
+                records (list of dict): see pareto_sweep, with the frontier
+                    coordinates and labels as numpy arrays
+    """
+    records = []
+    with open(store) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record['frontier'] = np.array(record['frontier'],
+                                          dtype=float).reshape(-1, 2)
+            record['labels'] = [np.array(labels, dtype=np.int64)
+                                for labels in record['labels']]
+            records.append(record)
+
+    return records
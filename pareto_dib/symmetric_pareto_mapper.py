@@ -1,86 +1,271 @@
-from time import time
+from functools import partial
 
 import numpy as np
+import scipy.sparse as sp
 
-from .classification_utils import (combine_cmaps, entropy, merge_joint_sym,
-                                   mutual_information, single_cluster_cmap)
+from .classification_utils import (entropy, identity_labels,
+                                   joint_from_labels_sym, merge_costs_sym,
+                                   merge_pair_packed, mutual_information,
+                                   pack_sym, unpack_sym)
+from .jit_utils import get_kernels
 from .pareto_set import ParetoSet
+from .search_utils import iter_beam_search, iter_pareto_search, make_rng
 
 
-def symmetric_pareto_mapper(p3d, epsilon=1e-8):
+def _evaluate_sym(nent, mi, pc3d, labels=None, costs=merge_costs_sym,
+                  symmetric=False):
+    dH, dI = costs(pc3d, symmetric)
+
+    return nent + dH, mi - dI
+
+
+# symmetric joints are stored as their upper triangle, see pack_sym, and
+# merged on it by merge_pair_packed; the costs of every pair of rows are
+# computed on the joint unpacked once per searched point
+
+def _evaluate_packed(nent, mi, u, labels=None, costs=merge_costs_sym):
+    dH, dI = costs(unpack_sym(u), symmetric=True)
+
+    return nent + dH, mi - dI
+
+
+def _joint_packed(p3d, labels):
+    return pack_sym(joint_from_labels_sym(p3d, labels))
+
+
+def _unpack_point(point):
+    return point[0:3] + (unpack_sym(point[3]),)
+
+
+def _unpacked_events(events, packed, unpacked):
+    # events of a search, with the joints of inserted points unpacked if
+    # packed and kept in unpacked until removed, returns the 'done' data
+    for kind, data in events:
+        if kind == 'done':
+            return data
+        elif packed and kind == 'insert' and data[3] is not None:
+            unpacked[id(data)] = _unpack_point(data)
+            yield kind, unpacked[id(data)]
+        elif packed and kind == 'remove' and data[3] is not None:
+            yield kind, unpacked.pop(id(data))
+        else:
+            yield kind, data
+
+
+def symmetric_pareto_mapper(p3d, epsilon=1e-8, seed=None,
+                            workers=None, checkpoint=None,
+                            checkpoint_interval=600., resume_from=None,
+                            max_queue_memory=None, backend='numpy',
+                            dedup='coordinates', profile=False,
+                            order='lifo', beam_width=None,
+                            warm_start=None, store_joints=True):
     """
     Symmetric Pareto Mapper
 
         Parameters:
-                p (numpy.ndarray): joint distribution p_{X1 X2; Y}
+                p (numpy.ndarray or scipy.sparse matrix): joint
+                    distribution p_{X1 X2; Y}, a sparse p is given as a
+                    (N N, |Y|) matrix with row x1 N + x2 and is kept sparse
+                    (CSR) throughout
                 eps (float, optional): search depth, default 1e-12
+                seed (int or numpy.random.Generator, optional): seed of the
+                    acceptance draws, default None draws a fresh seed which
+                    is reported in run_stats
+                workers (int, optional): number of processes used to evaluate
+                    merges, default None runs in a single process
+                checkpoint (str, optional): file to periodically save the
+                    search state to
+                checkpoint_interval (float, optional): seconds between
+                    checkpoints, default 600
+                resume_from (str, optional): checkpoint of an interrupted
+                    search of the same joint to resume
+                max_queue_memory (int, optional): bytes of joints kept in the
+                    search queue, joints beyond it are rebuilt when popped,
+                    the up to 2 workers points evaluated ahead of time by
+                    the pool are not counted, default None is unbounded
+                backend (str, optional): 'numpy' (default) or 'numba' for
+                    compiled merge kernels, which give identical frontiers
+                    and fall back to 'numpy' if numba is not importable
+                dedup (str, optional): 'coordinates' (default) searches each
+                    (-H, I) rounded to 8 decimals once, which also prunes
+                    partitions related by a symmetry of the joint, and
+                    'partition' searches each partition once
+                profile (bool, optional): if True, run_stats['profile'] holds
+                    timings per search phase and search event counts, see
+                    SearchProfile
+                order (str, optional): 'lifo' (default) or 'best', see
+                    pareto_mapper
+                beam_width (int, optional): beam search keeping the
+                    beam_width best partitions of each number of clusters,
+                    see pareto_mapper
+                warm_start (int, optional): number of greedy sweeps seeding
+                    the frontier, see pareto_mapper
+                store_joints (bool, optional): if False, the frontier keeps
+                    (-H, I, labels, None) tuples, whose pc3d
+                    pset.get_joint(i) rebuilds from p3d, which takes
+                    O(|frontier| N) instead of O(|frontier| m^2 |Y|) memory,
+                    default True
 
         Returns:
-                pset (ParetoSet): DIB pset frontier
+                pset (ParetoSet): DIB pset frontier of (-H, I, labels, pc3d)
+                    tuples, where labels maps each x to its cluster
                 run_stats (dict): performance statistics
     """
-    # params
-    N = p3d.shape[0]
+    for kind, data in _iter_symmetric_pareto_mapper(
+            p3d, epsilon=epsilon, seed=seed, workers=workers,
+            checkpoint=checkpoint, checkpoint_interval=checkpoint_interval,
+            resume_from=resume_from, max_queue_memory=max_queue_memory,
+            backend=backend, dedup=dedup, profile=profile, order=order,
+            beam_width=beam_width, warm_start=warm_start,
+            store_joints=store_joints, max_time=None, max_nodes=None,
+            max_stable=None, stats_interval=None, emit=False):
+        pass
 
-    # plot pruned search points
-    Zdim = p3d.shape[2]
-    cmap0 = {x: {x, } for x in range(p3d.shape[0])}
+    return data
 
-    pset = ParetoSet()
-    Imax = mutual_information(p3d.reshape(-1, Zdim))
-    Hmax = -entropy(p3d.sum(-1).reshape(-1))
-    new_point = (Hmax, Imax, cmap0, p3d)
 
-    Q = []
-    Q.append(new_point)
+def iter_symmetric_pareto_mapper(p3d, epsilon=1e-8, seed=None,
+                                 workers=None, checkpoint=None,
+                                 checkpoint_interval=600., resume_from=None,
+                                 max_queue_memory=None, backend='numpy',
+                                 dedup='coordinates', profile=False,
+                                 order='lifo', beam_width=None,
+                                 warm_start=None, store_joints=True,
+                                 max_time=None, max_nodes=None,
+                                 max_stable=None, stats_interval=1.):
+    """
+    Symmetric Pareto Mapper as a generator of frontier updates
+
+        Parameters:
+                p3d, epsilon, seed, workers, checkpoint,
+                checkpoint_interval, resume_from, max_queue_memory, backend,
+                dedup, profile, order, beam_width, warm_start, store_joints:
+                see symmetric_pareto_mapper
+                max_time, max_nodes, max_stable, stats_interval: search
+                    budgets and stats events, see iter_pareto_mapper
+
+        Yields:
+                ('insert', point), ('remove', point), ('stats', stats) and
+                    lastly ('done', (pset, run_stats)), see
+                    iter_pareto_mapper
+    """
+    yield from _iter_symmetric_pareto_mapper(
+        p3d, epsilon=epsilon, seed=seed, workers=workers,
+        checkpoint=checkpoint, checkpoint_interval=checkpoint_interval,
+        resume_from=resume_from, max_queue_memory=max_queue_memory,
+        backend=backend, dedup=dedup, profile=profile, order=order,
+        beam_width=beam_width, warm_start=warm_start,
+        store_joints=store_joints, max_time=max_time, max_nodes=max_nodes,
+        max_stable=max_stable, stats_interval=stats_interval, emit=True)
+
 
-    tried = set()
-    count = 0
-    t0 = time()
+def _iter_symmetric_pareto_mapper(p3d, epsilon, seed, workers, checkpoint,
+                                  checkpoint_interval, resume_from,
+                                  max_queue_memory, backend, dedup, profile,
+                                  order, beam_width, warm_start,
+                                  store_joints, max_time, max_nodes,
+                                  max_stable, stats_interval, emit):
+    # iter_symmetric_pareto_mapper, yielding only the 'done' event if not
+    # emit, in which case packed joints are unpacked once at the end
 
-    while Q:
-        count += 1
-        point = Q.pop()
-        nent, mi, cmap, pc3d = point
+    # params
+    if sp.issparse(p3d):
+        p3d = sp.csr_matrix(p3d)
+        N, Zdim = int(np.rint(np.sqrt(p3d.shape[0]))), p3d.shape[1]
+    else:
+        # kernels sum contiguous rows, see jit_utils
+        p3d = np.ascontiguousarray(p3d, dtype=float)
+        N, Zdim = p3d.shape[0], p3d.shape[2]
+
+    # cluster assignments are stored as label arrays, see labels_to_cmap
+    labels0 = identity_labels(N)
 
-        for j in range(len(cmap)):
-            for k in range(len(cmap)):
-                if j >= k:
-                    continue
+    Imax = mutual_information(p3d.reshape(-1, Zdim))
+    Hmax = -entropy(np.asarray(p3d.sum(-1)).reshape(-1))
 
-                dcmap = single_cluster_cmap(len(cmap), (j, k))
-                ncmap = combine_cmaps(cmap, dcmap)
+    rng, seed = make_rng(seed)
+    backend, (_, costs, _, merge) = get_kernels(backend)
 
-                p_new3d = merge_joint_sym(pc3d, dcmap)
+    packed = False
+    if sp.issparse(p3d):
+        # rows x1 N + x2 and x2 N + x1 hold the same entries if symmetric
+        swap = np.arange(N * N).reshape(N, N).T.reshape(-1)
+        symmetric = (p3d[swap] != p3d).nnz == 0
 
-                H = entropy(p_new3d.sum(-1).reshape(-1))
-                I = mutual_information(p_new3d.reshape(-1, Zdim))
+        new_point = (Hmax, Imax, labels0, p3d)
+        evaluate = partial(_evaluate_sym, costs=costs, symmetric=symmetric)
+        joint = partial(joint_from_labels_sym, p3d)
+    elif np.array_equal(p3d, p3d.transpose(1, 0, 2)):
+        packed = True
+        new_point = (Hmax, Imax, labels0, pack_sym(p3d))
+        evaluate = partial(_evaluate_packed, costs=costs)
+        merge = merge_pair_packed
+        joint = partial(_joint_packed, p3d)
+    else:
+        new_point = (Hmax, Imax, labels0, p3d)
+        evaluate = partial(_evaluate_sym, costs=costs)
+        joint = partial(joint_from_labels_sym, p3d)
 
-                new_point = (-H,
-                             I,
-                             ncmap,
-                             p_new3d)
+    if beam_width is None:
+        events = iter_pareto_search(new_point, evaluate, merge, epsilon, rng,
+                                    workers=workers,
+                                    test_parent=True,
+                                    joint=joint,
+                                    checkpoint=checkpoint,
+                                    checkpoint_interval=checkpoint_interval,
+                                    resume_from=resume_from,
+                                    max_queue_memory=max_queue_memory,
+                                    dedup=dedup,
+                                    profile=profile,
+                                    order=order,
+                                    warm_start=warm_start,
+                                    store_joints=store_joints,
+                                    max_time=max_time,
+                                    max_nodes=max_nodes,
+                                    max_stable=max_stable,
+                                    stats_interval=stats_interval)
+    elif (workers is not None and workers > 1) or checkpoint is not None or \
+            resume_from is not None or max_queue_memory is not None or \
+            order != 'lifo' or warm_start:
+        raise ValueError("beam_width cannot be combined with workers, "
+                         "checkpoint, resume_from, max_queue_memory, order "
+                         "or warm_start")
+    else:
+        events = iter_beam_search(new_point, evaluate, merge, beam_width,
+                                  test_parent=True,
+                                  dedup=dedup,
+                                  profile=profile,
+                                  store_joints=store_joints,
+                                  max_time=max_time,
+                                  max_nodes=max_nodes,
+                                  max_stable=max_stable,
+                                  stats_interval=stats_interval)
 
-                # evaluate point, and attempt insertion into Pareto Set
-                pset.add(new_point)
-                a = pset.add(point)
-                b = np.exp(-pset.distance(point) / epsilon) > np.random.rand()
+    # yielded frontier points with unpacked joints, by id of the packed
+    # point, so that a removed point is the tuple that was inserted
+    unpacked = {}
 
-                # check that point has not been tried
-                pid = (round(new_point[0], 8), round(new_point[1], 8))
-                if (a or b) and (pid not in tried):
-                    tried.add(pid)
-                    Q.append(new_point)
+    if emit:
+        pset, stats = yield from _unpacked_events(events, packed, unpacked)
+    else:
+        for kind, data in events:
+            pass
+        pset, stats = data
 
-    tf = time()
+    if packed and store_joints:
+        packed, pset = pset, ParetoSet()
+        pset.from_list(unpacked[id(x)] if id(x) in unpacked else
+                       _unpack_point(x) for x in packed)
+    pset.joint = partial(joint_from_labels_sym, p3d)
 
     # save run stats
     run_stats = {}
     run_stats['N'] = N
-    run_stats['searched'] = count
-    run_stats['time'] = float(tf - t0)
+    run_stats.update(stats)
     run_stats['pset_size'] = len(pset)
     run_stats['epsilon'] = epsilon
+    run_stats['seed'] = seed
+    run_stats['workers'] = workers
+    run_stats['backend'] = backend
 
-    # save
-    return pset, run_stats
+    yield 'done', (pset, run_stats)
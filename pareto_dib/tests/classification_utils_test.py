@@ -1,8 +1,21 @@
 import unittest
 
 import numpy as np
+import scipy.sparse as sp
 
-from pareto_dib.classification_utils import merge_joint_sym
+from pareto_dib.classification_utils import (canonical_labels,
+                                             cmap_to_labels, combine_cmaps,
+                                             compose_labels, entropy,
+                                             entropy_diff, joint_from_labels,
+                                             joint_from_labels_sym,
+                                             labels_to_cmap, merge_costs,
+                                             merge_costs_sym, merge_joint,
+                                             merge_joint_sym, merge_labels,
+                                             merge_pair, merge_pair_packed,
+                                             merge_pair_sym,
+                                             mutual_information, pack_sym,
+                                             single_cluster_cmap, unpack_sym,
+                                             weighted_jsd)
 
 
 class ClassificationUtilTests(unittest.TestCase):
@@ -34,6 +47,148 @@ class ClassificationUtilTests(unittest.TestCase):
         self.assertEqual(pxy_ans.shape, pxy_mer.shape)
         np.testing.assert_array_almost_equal(pxy_ans, pxy_mer)
 
+    def test_merge_costs(self):
+        rng = np.random.default_rng(0)
+        pxy = rng.random((6, 5))
+        pxy[2, :] = 0.
+        pxy[4, 1:3] = 0.
+        pxy /= pxy.sum()
+
+        dH, dI = merge_costs(pxy)
+
+        self.assertEqual(dH.shape, (6, 6))
+        self.assertEqual(dI.shape, (6, 6))
+        for j in range(6):
+            for k in range(6):
+                if j >= k:
+                    self.assertEqual(dH[j, k], 0.)
+                    self.assertEqual(dI[j, k], 0.)
+                    continue
+
+                # merges tie as they do pair by pair
+                self.assertEqual(dH[j, k], entropy_diff(pxy.sum(1)[[j, k]]))
+                self.assertEqual(dI[j, k],
+                                 weighted_jsd(pxy[j, :], pxy[k, :]))
+
+    def test_merge_costs_sym(self):
+        rng = np.random.default_rng(0)
+        pxxy = rng.random((5, 5, 3))
+        pxxy[1, :, :] = 0.
+        pxxy /= pxxy.sum()
+        sym = (pxxy + pxxy.transpose(1, 0, 2)) / 2
+
+        def coords(p):
+            return (-entropy(p.sum(-1).ravel()),
+                    mutual_information(p.reshape(-1, p.shape[-1])))
+
+        for p, symmetric in ((pxxy, False), (sym, False), (sym, True)):
+            dH, dI = merge_costs_sym(p, symmetric)
+            H, I = coords(p)
+
+            for j in range(5):
+                for k in range(j + 1, 5):
+                    Hc, Ic = coords(merge_pair_sym(p, j, k))
+
+                    self.assertAlmostEqual(H + dH[j, k], Hc)
+                    self.assertAlmostEqual(I - dI[j, k], Ic)
+
+    def test_pack_sym(self):
+        rng = np.random.default_rng(0)
+        pxxy = rng.random((4, 4, 3))
+        pxxy += pxxy.transpose(1, 0, 2)
+
+        u = pack_sym(pxxy)
+
+        self.assertEqual(u.shape, (10, 3))
+        np.testing.assert_array_equal(unpack_sym(u), pxxy)
+
+        for j in range(4):
+            for k in range(j + 1, 4):
+                np.testing.assert_array_equal(
+                    merge_pair_packed(u, j, k),
+                    pack_sym(merge_pair_sym(pxxy, j, k)))
+
+    def test_sparse(self):
+        rng = np.random.default_rng(0)
+        pxy = rng.random((6, 5)) * (rng.random((6, 5)) < 0.4)
+        pxy /= pxy.sum()
+        pxxy = rng.random((5, 5, 3)) * (rng.random((5, 5, 3)) < 0.3)
+        pxxy /= pxxy.sum()
+        sym = (pxxy + pxxy.transpose(1, 0, 2)) / 2
+
+        S = sp.csr_matrix(pxy)
+        self.assertAlmostEqual(mutual_information(S),
+                               mutual_information(pxy))
+        for a, b in zip(merge_costs(S), merge_costs(pxy)):
+            np.testing.assert_array_almost_equal(a, b)
+        np.testing.assert_array_almost_equal(
+            merge_pair(S, 1, 4).toarray(), merge_pair(pxy, 1, 4))
+
+        labels = np.array([0, 1, 0, 2, 1], dtype=np.uint8)
+        for p, symmetric in ((pxxy, False), (sym, True)):
+            S = sp.csr_matrix(p.reshape(25, 3))
+
+            for a, b in zip(merge_costs_sym(S, symmetric),
+                            merge_costs_sym(p, symmetric)):
+                np.testing.assert_array_almost_equal(a, b)
+            np.testing.assert_array_almost_equal(
+                merge_pair_sym(S, 0, 3).toarray(),
+                merge_pair_sym(p, 0, 3).reshape(16, 3))
+            np.testing.assert_array_almost_equal(
+                joint_from_labels_sym(S, labels).toarray(),
+                joint_from_labels_sym(p, labels).reshape(9, 3))
+
+    def test_merge_pair(self):
+        rng = np.random.default_rng(0)
+        pxy = rng.random((5, 3))
+        pxxy = rng.random((5, 5, 3))
+
+        for j in range(5):
+            for k in range(j + 1, 5):
+                cmap = single_cluster_cmap(5, (j, k))
+
+                np.testing.assert_array_almost_equal(
+                    merge_pair(pxy, j, k), merge_joint(pxy, cmap))
+                np.testing.assert_array_almost_equal(
+                    merge_pair_sym(pxxy, j, k), merge_joint_sym(pxxy, cmap))
+
+    def test_labels(self):
+        cmap = {0: {1, 4}, 1: {0}, 2: {2, 3, 5}}
+        labels = cmap_to_labels(cmap)
+
+        np.testing.assert_array_equal(labels, [1, 0, 2, 2, 0, 2])
+        self.assertEqual(labels_to_cmap(labels), cmap)
+
+        for j in range(3):
+            for k in range(j + 1, 3):
+                dcmap = single_cluster_cmap(3, (j, k))
+                ncmap = combine_cmaps(cmap, dcmap)
+
+                self.assertEqual(labels_to_cmap(merge_labels(labels, j, k)),
+                                 ncmap)
+                self.assertEqual(
+                    labels_to_cmap(
+                        compose_labels(labels, cmap_to_labels(dcmap))),
+                    ncmap)
+
+        np.testing.assert_array_equal(canonical_labels(labels),
+                                      [0, 1, 2, 2, 1, 2])
+        np.testing.assert_array_equal(
+            canonical_labels(np.array([2, 0, 1, 1, 0, 1])),
+            canonical_labels(labels))
+
+    def test_joint_from_labels(self):
+        rng = np.random.default_rng(0)
+        pxy = rng.random((5, 3))
+        pxxy = rng.random((5, 5, 3))
+        cmap = {0: {1, 4}, 1: {0}, 2: {2, 3}}
+        labels = cmap_to_labels(cmap)
+
+        np.testing.assert_array_almost_equal(joint_from_labels(pxy, labels),
+                                             merge_joint(pxy, cmap))
+        np.testing.assert_array_almost_equal(
+            joint_from_labels_sym(pxxy, labels), merge_joint_sym(pxxy, cmap))
+
 
 if __name__ == "__main__":
     unittest.main()
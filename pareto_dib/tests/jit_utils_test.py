@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+
+from pareto_dib import classification_utils, jit_utils
+
+
+class JitUtilTests(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def test_pairwise_sum(self):
+        rng = np.random.default_rng(0)
+
+        for n in [0, 1, 7, 8, 9, 128, 129, 1000, 4097]:
+            a = rng.random(n) * 10. ** rng.uniform(-8, 8, n)
+            self.assertEqual(jit_utils._pairwise_sum(a, 0, n), np.sum(a))
+
+    def test_kernels(self):
+        rng = np.random.default_rng(0)
+
+        for m, n in [(1, 3), (2, 1), (6, 5), (9, 140)]:
+            pxy = rng.random((m, n)) * (rng.random((m, n)) < 0.6)
+            pxy /= pxy.sum()
+
+            for a, b in zip(jit_utils.merge_costs(pxy),
+                            classification_utils.merge_costs(pxy)):
+                np.testing.assert_array_equal(a, b)
+
+            if m > 2:
+                np.testing.assert_array_equal(
+                    jit_utils.merge_pair(pxy, 0, m - 1),
+                    classification_utils.merge_pair(pxy, 0, m - 1))
+
+        for m, z in [(1, 3), (5, 3), (9, 20)]:
+            pxxy = rng.random((m, m, z)) * (rng.random((m, m, z)) < 0.6)
+            pxxy /= pxxy.sum()
+            sym = (pxxy + pxxy.transpose(1, 0, 2)) / 2
+
+            for p, symmetric in ((pxxy, False), (sym, True)):
+                for a, b in zip(
+                        jit_utils.merge_costs_sym(p, symmetric),
+                        classification_utils.merge_costs_sym(p, symmetric)):
+                    np.testing.assert_array_equal(a, b)
+
+                if m > 2:
+                    np.testing.assert_array_equal(
+                        jit_utils.merge_pair_sym(p, 0, 2),
+                        classification_utils.merge_pair_sym(p, 0, 2))
+
+    def test_get_kernels(self):
+        backend, kernels = jit_utils.get_kernels('numpy')
+
+        self.assertEqual(backend, 'numpy')
+        self.assertIs(kernels[0], classification_utils.merge_costs)
+
+        with self.assertRaises(ValueError):
+            jit_utils.get_kernels('fortran')
+
+
+if __name__ == "__main__":
+    unittest.main()
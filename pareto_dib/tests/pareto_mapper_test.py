@@ -0,0 +1,344 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import scipy.sparse as sp
+
+from pareto_dib import (iter_pareto_mapper, iter_symmetric_pareto_mapper,
+                        pareto_mapper, symmetric_pareto_mapper)
+from pareto_dib.classification_utils import (joint_from_labels, merge_costs,
+                                             merge_pair)
+from pareto_dib.pareto_mapper import MergeCostCache
+
+
+class ParetoMapperTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+
+        self.pxy = rng.random((7, 4))
+        self.pxy /= self.pxy.sum()
+
+        # Z = X1 + X2 mod 5 with uniform X1, X2
+        self.pxxy = np.zeros((5, 5, 5))
+        for x1 in range(5):
+            for x2 in range(5):
+                self.pxxy[x1, x2, (x1 + x2) % 5] = 1 / 25
+
+    def test_seed(self):
+        pset, run_stats = pareto_mapper(self.pxy, epsilon=1e-2, seed=1)
+        pset_rep, run_stats_rep = pareto_mapper(self.pxy, epsilon=1e-2,
+                                                seed=run_stats['seed'])
+
+        self.assertEqual(run_stats['searched'], run_stats_rep['searched'])
+        np.testing.assert_array_equal(pset.to_array(), pset_rep.to_array())
+
+        _, run_stats = pareto_mapper(self.pxy)
+        self.assertIsInstance(run_stats['seed'], int)
+
+        _, run_stats = pareto_mapper(self.pxy,
+                                     seed=np.random.default_rng(0))
+        self.assertIsNone(run_stats['seed'])
+
+    def test_workers(self):
+        pset, _ = pareto_mapper(self.pxy, seed=0)
+        pset_par, run_stats = pareto_mapper(self.pxy, seed=0, workers=2)
+
+        self.assertEqual(run_stats['workers'], 2)
+        np.testing.assert_array_equal(pset.to_array(), pset_par.to_array())
+
+    def test_workers_symmetric(self):
+        pset, _ = symmetric_pareto_mapper(self.pxxy, seed=0)
+        pset_par, _ = symmetric_pareto_mapper(self.pxxy, seed=0, workers=2)
+
+        np.testing.assert_array_equal(pset.to_array(), pset_par.to_array())
+
+    def test_backend(self):
+        for mapper, p in ((pareto_mapper, self.pxy),
+                          (symmetric_pareto_mapper, self.pxxy)):
+            pset, _ = mapper(p, seed=0, backend='numpy')
+            pset_jit, run_stats = mapper(p, seed=0, backend='numba')
+
+            self.assertIn(run_stats['backend'], ('numpy', 'numba'))
+            np.testing.assert_array_equal(pset.to_array(),
+                                          pset_jit.to_array())
+
+    def test_cache(self):
+        pset, run_stats = pareto_mapper(self.pxy, seed=0)
+        self.assertIsNone(run_stats['cache_hit_rate'])
+
+        for cache_size in [10, 1000]:
+            pset_cached, run_stats = pareto_mapper(self.pxy, seed=0,
+                                                   cache_size=cache_size)
+
+            self.assertGreater(run_stats['cache_hit_rate'], 0.)
+            np.testing.assert_array_almost_equal(pset.to_array(),
+                                                 pset_cached.to_array())
+
+        with self.assertRaises(ValueError):
+            pareto_mapper(self.pxy, cache_size=1000, workers=2)
+
+        # clusters {0, 1}, {2}, ..., {6} and then {0, 1}, {2, 3}, {4}, ...,
+        # {6}, where the 6 pairs of clusters other than {2, 3} are reused
+        q1 = merge_pair(self.pxy, 0, 1)[[5, 0, 1, 2, 3, 4]]
+        q2 = merge_pair(q1, 1, 2)[[0, 4, 1, 2, 3]]
+
+        cache = MergeCostCache(7, 1000)
+        cache(0., 0., q1, np.array([0, 0, 1, 2, 3, 4, 5]))
+        Hc, Ic = cache(0., 0., q2, np.array([0, 0, 1, 1, 2, 3, 4]))
+
+        self.assertEqual(cache.hits, 6)
+        dH, dI = merge_costs(q2)
+        np.testing.assert_array_almost_equal(Hc, dH)
+        np.testing.assert_array_almost_equal(Ic, -dI)
+
+    def test_dedup(self):
+        pset, run_stats = pareto_mapper(self.pxy, seed=0)
+        pset_coords, run_stats_coords = pareto_mapper(self.pxy, seed=0,
+                                                      dedup='coordinates')
+
+        self.assertEqual(run_stats['searched'], run_stats_coords['searched'])
+        np.testing.assert_array_equal(pset.to_array(),
+                                      pset_coords.to_array())
+
+        # partitions related by a symmetry have the same coordinates
+        _, run_stats = symmetric_pareto_mapper(self.pxxy, seed=0)
+        _, run_stats_part = symmetric_pareto_mapper(self.pxxy, seed=0,
+                                                    dedup='partition')
+        self.assertGreater(run_stats_part['searched'], run_stats['searched'])
+
+        with self.assertRaises(ValueError):
+            pareto_mapper(self.pxy, dedup='labels')
+
+    def test_profile(self):
+        pset, run_stats = pareto_mapper(self.pxy, seed=0)
+        self.assertIsNone(run_stats['profile'])
+
+        for mapper, p in ((pareto_mapper, self.pxy),
+                          (symmetric_pareto_mapper, self.pxxy)):
+            pset, run_stats = mapper(p, seed=0)
+            pset_prof, run_stats_prof = mapper(p, seed=0, profile=True)
+            np.testing.assert_array_equal(pset.to_array(),
+                                          pset_prof.to_array())
+
+            profile = run_stats_prof['profile']
+            self.assertLessEqual(sum(profile['times'].values()),
+                                 run_stats_prof['time'])
+            self.assertEqual(len(profile['queue_depth']),
+                             run_stats_prof['searched'])
+
+            # every searched point but the root was queued once
+            counts = profile['counts']
+            self.assertEqual(counts['queued'], run_stats_prof['searched'] - 1)
+            self.assertLessEqual(counts['pareto'] + counts['epsilon'],
+                                 counts['children'])
+
+    def test_resume(self):
+        pset, run_stats = pareto_mapper(self.pxy, epsilon=1e-2, seed=0)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "checkpoint.npz")
+
+            # checkpoint before every pop, the file holds the last state
+            pareto_mapper(self.pxy, epsilon=1e-2, seed=0, checkpoint=path,
+                          checkpoint_interval=0.)
+            pset_res, run_stats_res = pareto_mapper(self.pxy, epsilon=1e-2,
+                                                    resume_from=path)
+
+        self.assertEqual(run_stats['searched'], run_stats_res['searched'])
+        np.testing.assert_array_almost_equal(pset.to_array(),
+                                             pset_res.to_array())
+        for x, y in zip(pset, pset_res):
+            np.testing.assert_array_equal(x[2], y[2])
+            np.testing.assert_array_almost_equal(x[3], y[3])
+
+    def test_iter(self):
+        for mapper, iter_mapper, p in (
+                (pareto_mapper, iter_pareto_mapper, self.pxy),
+                (symmetric_pareto_mapper, iter_symmetric_pareto_mapper,
+                 self.pxxy)):
+            pset, run_stats = mapper(p, seed=0)
+
+            # replaying the changes gives the frontier
+            frontier = {}
+            for kind, data in iter_mapper(p, seed=0, stats_interval=0.):
+                if kind == 'insert':
+                    frontier[id(data)] = data
+                elif kind == 'remove':
+                    del frontier[id(data)]
+                elif kind == 'stats':
+                    self.assertLessEqual(data['searched'],
+                                         run_stats['searched'])
+
+            pset_iter, run_stats_iter = data
+            self.assertIsNone(run_stats_iter['stopped'])
+            self.assertEqual(set(frontier), {id(x) for x in pset_iter})
+            np.testing.assert_array_equal(pset.to_array(),
+                                          pset_iter.to_array())
+
+        for kind, data in iter_pareto_mapper(self.pxy, seed=0, max_nodes=5):
+            pass
+        self.assertEqual(data[1]['searched'], 5)
+        self.assertEqual(data[1]['stopped'], 'max_nodes')
+
+        # a stopped search is checkpointed
+        pset, run_stats = pareto_mapper(self.pxy, epsilon=1e-2, seed=0)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "checkpoint.npz")
+
+            for kind, data in iter_pareto_mapper(self.pxy, epsilon=1e-2,
+                                                 seed=0, checkpoint=path,
+                                                 max_stable=1):
+                pass
+            self.assertEqual(data[1]['stopped'], 'max_stable')
+
+            pset_res, run_stats_res = pareto_mapper(self.pxy, epsilon=1e-2,
+                                                    resume_from=path)
+
+        self.assertEqual(run_stats['searched'], run_stats_res['searched'])
+        np.testing.assert_array_almost_equal(pset.to_array(),
+                                             pset_res.to_array())
+
+    def test_order(self):
+        for mapper, p in ((pareto_mapper, self.pxy),
+                          (symmetric_pareto_mapper, self.pxxy)):
+            pset, run_stats = mapper(p, seed=0)
+            pset_best, _ = mapper(p, seed=0, order='best')
+
+            # the frontier is exact at this depth
+            np.testing.assert_array_almost_equal(pset.to_array(),
+                                                 pset_best.to_array())
+
+            # the same search with prefetching workers and a queue budget
+            pset_par, _ = mapper(p, seed=0, order='best', workers=2,
+                                 max_queue_memory=0)
+            np.testing.assert_array_almost_equal(pset_best.to_array(),
+                                                 pset_par.to_array())
+
+        with self.assertRaises(ValueError):
+            pareto_mapper(self.pxy, order='fifo')
+
+    def test_beam(self):
+        for mapper, p in ((pareto_mapper, self.pxy),
+                          (symmetric_pareto_mapper, self.pxxy)):
+            pset, _ = mapper(p, seed=0)
+
+            # a greedy sweep of one partition per number of clusters, from
+            # the root, which is inserted only if the epsilon search of the
+            # mapper inserts it
+            pset_beam, run_stats = mapper(p, beam_width=1)
+            self.assertEqual(run_stats['searched'], p.shape[0])
+            self.assertEqual(np.all(np.diff(pset_beam[0][2]) == 1),
+                             np.all(np.diff(pset[0][2]) == 1))
+
+            ref = (min(pset[0][0], pset_beam[0][0]), 0.)
+            self.assertLessEqual(pset_beam.hypervolume(ref),
+                                 pset.hypervolume(ref) + 1e-12)
+
+            # every partition, at least as good as the epsilon search
+            pset_beam, _ = mapper(p, beam_width=1000)
+            self.assertGreaterEqual(pset_beam.hypervolume(ref),
+                                    pset.hypervolume(ref) - 1e-12)
+
+        for x in pareto_mapper(self.pxy, beam_width=4)[0]:
+            np.testing.assert_array_almost_equal(
+                x[3], joint_from_labels(self.pxy, x[2]))
+
+        with self.assertRaises(ValueError):
+            pareto_mapper(self.pxy, beam_width=4, workers=2)
+
+    def test_warm_start(self):
+        for mapper, p in ((pareto_mapper, self.pxy),
+                          (symmetric_pareto_mapper, self.pxxy)):
+            pset, run_stats = mapper(p, seed=0)
+            self.assertEqual(run_stats['warm_start_searched'], 0)
+
+            for warm_start in (1, 2, 4):
+                pset_warm, run_stats_warm = mapper(p, seed=0,
+                                                   warm_start=warm_start)
+
+                # sweeps of n evaluations, queued with the root
+                self.assertEqual(run_stats_warm['warm_start_searched'],
+                                 warm_start * p.shape[0])
+                self.assertGreater(run_stats_warm['searched'], 1)
+
+                # the frontier of the cold start is found
+                np.testing.assert_array_almost_equal(pset.to_array(),
+                                                     pset_warm.to_array())
+
+        with self.assertRaises(ValueError):
+            pareto_mapper(self.pxy, beam_width=4, warm_start=1)
+
+    def test_store_joints(self):
+        runs = [(pareto_mapper, self.pxy, {}),
+                (pareto_mapper, self.pxy, {'beam_width': 2}),
+                (symmetric_pareto_mapper, self.pxxy, {})]
+
+        for mapper, p, kwargs in runs:
+            pset, run_stats = mapper(p, seed=0, **kwargs)
+            pset_lean, run_stats_lean = mapper(p, seed=0, store_joints=False,
+                                               **kwargs)
+
+            self.assertEqual(run_stats['searched'],
+                             run_stats_lean['searched'])
+            np.testing.assert_array_equal(pset.to_array(),
+                                          pset_lean.to_array())
+
+            # joints are rebuilt from the labels
+            for i, (x, y) in enumerate(zip(pset, pset_lean)):
+                np.testing.assert_array_equal(x[2], y[2])
+                self.assertIsNone(y[3])
+                np.testing.assert_array_almost_equal(pset_lean.get_joint(i),
+                                                     x[3])
+                np.testing.assert_array_almost_equal(pset.get_joint(i), x[3])
+
+        for kind, data in iter_symmetric_pareto_mapper(self.pxxy, seed=0,
+                                                       store_joints=False):
+            if kind in ('insert', 'remove'):
+                self.assertIsNone(data[3])
+
+    def test_queue_memory(self):
+        pset, run_stats = symmetric_pareto_mapper(self.pxxy, seed=0)
+        pset_bnd, run_stats_bnd = symmetric_pareto_mapper(
+            self.pxxy, seed=0, max_queue_memory=0)
+
+        self.assertEqual(run_stats['searched'], run_stats_bnd['searched'])
+        self.assertLess(run_stats_bnd['peak_queue_memory'],
+                        run_stats['peak_queue_memory'])
+        np.testing.assert_array_almost_equal(pset.to_array(),
+                                             pset_bnd.to_array())
+
+    def test_sparse(self):
+        pxy = self.pxy.copy()
+        pxy[pxy < 0.03] = 0.
+        pxy /= pxy.sum()
+
+        pset, _ = pareto_mapper(pxy, seed=0)
+        pset_sp, _ = pareto_mapper(sp.csr_matrix(pxy), seed=0)
+
+        np.testing.assert_array_almost_equal(pset.to_array(),
+                                             pset_sp.to_array())
+        for x, y in zip(pset, pset_sp):
+            np.testing.assert_array_equal(x[2], y[2])
+            np.testing.assert_array_almost_equal(x[3], y[3].toarray())
+
+        for fmt in (sp.coo_matrix, sp.lil_matrix, sp.dok_matrix):
+            pset_sp, _ = pareto_mapper(fmt(pxy), seed=0)
+            np.testing.assert_array_almost_equal(pset.to_array(),
+                                                 pset_sp.to_array())
+
+        pset, _ = symmetric_pareto_mapper(self.pxxy, seed=0)
+        pset_sp, _ = symmetric_pareto_mapper(
+            sp.csr_matrix(self.pxxy.reshape(25, 5)), seed=0)
+
+        np.testing.assert_array_almost_equal(pset.to_array(),
+                                             pset_sp.to_array())
+        for x, y in zip(pset, pset_sp):
+            np.testing.assert_array_equal(x[2], y[2])
+            np.testing.assert_array_almost_equal(
+                x[3].reshape(-1, 5), y[3].toarray())
+
+
+if __name__ == "__main__":
+    unittest.main()
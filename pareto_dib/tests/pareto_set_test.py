@@ -1,8 +1,13 @@
+import io
+import os
+import tempfile
 import unittest
+from functools import partial
 
 import numpy as np
 
-from pareto_dib.pareto_set import ParetoSet
+from pareto_dib.classification_utils import joint_from_labels, merge_labels
+from pareto_dib.pareto_set import ParetoSet, upper_hull
 
 
 class PareoSetTests(unittest.TestCase):
@@ -72,6 +77,16 @@ class PareoSetTests(unittest.TestCase):
         self.assertAlmostEqual(self.PA.distance((0.75 - 1e-4, .1 - 1e-4)),
                                1e-4)
 
+    def test_distances(self):
+        points = np.array([(0.5, 0.5), (2, 0), (0.9, -1), (-1, 0),
+                           (0.2, 0.45), (0, 0), (0.75 - 1e-4, .1 - 1e-4)])
+
+        np.testing.assert_array_almost_equal(
+            self.PA.distances(points),
+            [0., 0., 0.1, 1., 0.05 * np.sqrt(2), np.sqrt(0.1**2 + 0.5**2),
+             1e-4])
+        np.testing.assert_array_equal(ParetoSet().distances(points), 0.)
+
     def test_contains(self):
         self.assertTrue((0., 1.) in self.PA)
         self.assertTrue((0.25, 0.9) in self.PA)
@@ -93,6 +108,176 @@ class PareoSetTests(unittest.TestCase):
         self.assertFalse((0.75 - 1e-6, .1 + 1e-6) in self.PA)
         self.assertFalse((0.75 - 1e-6, .1 - 1e-6) in self.PA)
 
+    def test_classify(self):
+        points = np.array([(0.5, 0.5),  # on frontier
+                           (0.75 + 1e-10, .1 - 1e-10),  # on frontier
+                           (0.125, 0.95),  # new
+                           (2, 2),  # new
+                           (0.2, 0.45),  # dominated
+                           (0, 0),  # dominated
+                           (0.9, -1)])  # dominated
+
+        status, dist = self.PA.classify(points)
+
+        np.testing.assert_array_equal(
+            status, [ParetoSet.FRONTIER] * 2 + [ParetoSet.NEW] * 2 +
+            [ParetoSet.DOMINATED] * 3)
+        for p, d in zip(points, dist):
+            self.assertAlmostEqual(self.PA.distance(tuple(p)), d)
+            self.assertEqual(self.PA.is_pareto(tuple(p)), d == 0.)
+
+        status, dist = ParetoSet().classify(points)
+        np.testing.assert_array_equal(status, ParetoSet.NEW)
+        np.testing.assert_array_equal(dist, 0.)
+
+    def test_add_many(self):
+        rng = np.random.default_rng(0)
+
+        for _ in range(10):
+            points = [tuple(x) for x in rng.random((200, 2))]
+            points += [tuple(x) for x in rng.integers(0, 4, (20, 2)) / 4]
+
+            P = ParetoSet(tol=1e-8)
+            P.from_list(points[:50])
+            P_seq = ParetoSet(tol=1e-8)
+            for p in points[:50]:
+                P_seq.add(p)
+
+            inserted = P.add_many(points[50:])
+            for p in points[50:]:
+                P_seq.add(p)
+
+            self.assertEqual(inserted, len(set(P_seq) & set(points[50:])))
+            np.testing.assert_array_equal(P.to_array(), P_seq.to_array())
+            self.assertEqual(P.to_list(), P_seq.to_list())
+
+        # points within tol of each other are inserted as by add
+        for _ in range(50):
+            base = rng.random((10, 2))
+            points = np.repeat(base, 3, axis=0) + \
+                rng.uniform(-2e-8, 2e-8, (30, 2))
+            points = [tuple(x) for x in points]
+
+            P = ParetoSet(tol=1e-8)
+            P.add_many(points[:10])
+            P_seq = ParetoSet(tol=1e-8)
+            for p in points:
+                P_seq.add(p)
+
+            P.add_many(points[10:])
+            self.assertEqual(P.to_list(), P_seq.to_list())
+
+        P = ParetoSet(tol=1e-8)
+        P.add_many([(0., 1.), (-5e-9, 1.5)])
+        self.assertEqual(P.to_list(), [(-5e-9, 1.5)])
+
+        PB = ParetoSet(tol=1e-8)
+        PB.add((0.25, 0.9))
+        PB.add((2., 0.))
+        P = self.PA + PB
+
+        self.assertIs(P, self.PA)
+        self.assertEqual(len(P), 5)
+        self.assertTrue((2., 0.) in P)
+        self.assertFalse((1., 0.) in P)
+
+    def test_changes(self):
+        rng = np.random.default_rng(0)
+        points = [tuple(x) for x in rng.random((300, 2))]
+
+        # replaying the changes rebuilds the set
+        for batch in (False, True):
+            P = ParetoSet(tol=1e-8)
+            P.changes = []
+            if batch:
+                P.add_many(points[:100])
+                P.add_many(points[100:])
+            else:
+                for p in points:
+                    P.add(p)
+
+            replay = []
+            for kind, p in P.changes:
+                if kind == 'insert':
+                    replay.append(p)
+                else:
+                    replay.remove(p)
+
+            self.assertEqual(sorted(replay), P.to_list())
+
+    def test_gaps(self):
+        points = np.array([[-1., 0.], [0.1, 0.], [0.6, 0.], [2., 0.]])
+        gaps = self.PA.gaps(points)
+
+        self.assertEqual(gaps[0], np.inf)
+        self.assertAlmostEqual(gaps[1], np.hypot(0.25, 0.1))
+        self.assertAlmostEqual(gaps[2], np.hypot(0.25, 0.4))
+        self.assertEqual(gaps[3], np.inf)
+
+    def test_hypervolume(self):
+        # boxes of the five points above (0, 0)
+        self.assertAlmostEqual(self.PA.hypervolume((0., 0.)),
+                               0.25 * 0.9 + 0.25 * 0.5 + 0.25 * 0.1)
+        self.assertEqual(ParetoSet().hypervolume((0., 0.)), 0.)
+
+    def test_hull(self):
+        # (0.5, 0.5) and (0.75, 0.1) lie below the chord from (0.25, 0.9)
+        # to (1, 0)
+        np.testing.assert_array_equal(self.PA.hull(), [0, 1, 4])
+
+        # points on an edge are kept
+        P = ParetoSet()
+        P.add_many([(0., 1.), (0.5, 0.5), (1., 0.)])
+        np.testing.assert_array_equal(P.hull(), [0, 1, 2])
+
+        P = ParetoSet()
+        P.add_many([(0., 1.), (0.2, 0.9), (0.5, 0.4), (1., 0.)])
+        np.testing.assert_array_equal(P.hull(), [0, 1, 3])
+        self.assertEqual(len(ParetoSet().hull()), 0)
+
+        # unsorted points, with a repeated first coordinate
+        points = np.array([[1., 0.], [0., 0.5], [0.5, 0.2], [0., 1.],
+                           [0.5, 0.6]])
+        np.testing.assert_array_equal(upper_hull(points), [3, 4, 0])
+
+    def test_save_load(self):
+        pxy = np.random.default_rng(0).random((4, 3))
+        labels = [np.arange(4, dtype=np.uint8)]
+        labels.append(merge_labels(labels[0], 0, 1))
+        labels.append(merge_labels(labels[1], 0, 1))
+
+        P = ParetoSet()
+        P.add((0., 1., labels[0], joint_from_labels(pxy, labels[0])))
+        P.add((0.5, 0.5, labels[1], None))
+        P.add((1., 0., labels[2], joint_from_labels(pxy, labels[2])))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'pset.npz')
+            P.save(path)
+
+            # labels are only read when the points are accessed
+            Q = ParetoSet.load(path, joint=partial(joint_from_labels, pxy))
+            self.assertEqual(len(Q), 3)
+            np.testing.assert_array_equal(Q.to_array(), P.to_array())
+
+            for i in range(3):
+                self.assertIsNone(Q[i][3])
+                np.testing.assert_array_equal(Q[i][2], labels[i])
+                np.testing.assert_array_almost_equal(
+                    Q.get_joint(i), joint_from_labels(pxy, labels[i]))
+
+        with self.assertRaises(ValueError):
+            P.get_joint(1)
+        np.testing.assert_array_equal(P.get_joint(2), P[2][3])
+
+        # sets without labels, and files
+        fh = io.BytesIO()
+        self.PA.save(fh)
+        fh.seek(0)
+        Q = ParetoSet.load(fh)
+        self.assertEqual(Q.to_list(), self.PA.to_list())
+        self.assertTrue(Q.add((0.6, 0.6)))
+
 
 if __name__ == "__main__":
     unittest.main()
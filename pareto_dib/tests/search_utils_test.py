@@ -0,0 +1,73 @@
+import unittest
+
+import numpy as np
+
+from pareto_dib.classification_utils import merge_labels
+from pareto_dib.search_utils import (KeySet, PrioritySearchQueue,
+                                     partition_key)
+
+
+class SearchUtilTests(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def test_partition_key(self):
+        labels = np.arange(5, dtype=np.uint8)
+
+        # the same partition reached in different merge orders
+        key = partition_key(merge_labels(merge_labels(labels, 0, 1), 0, 1))
+        self.assertEqual(
+            key, partition_key(merge_labels(merge_labels(labels, 2, 3), 0, 1)))
+        self.assertNotEqual(
+            key, partition_key(merge_labels(merge_labels(labels, 0, 2), 0, 1)))
+
+        self.assertEqual(len(key), 8)
+        self.assertEqual(len(partition_key(labels, digest_size=16)), 16)
+
+    def test_key_set(self):
+        rng = np.random.default_rng(0)
+        keys = [rng.bytes(16) for _ in range(3000)]
+
+        S = KeySet(digest_size=16)
+        for key in keys:
+            self.assertTrue(S.add(key))
+        for key in keys:
+            self.assertFalse(S.add(key))
+            self.assertIn(key, S)
+
+        self.assertEqual(len(S), 3000)
+        self.assertNotIn(rng.bytes(16), S)
+
+        S = KeySet.from_array(S.to_array())
+        self.assertEqual(len(S), 3000)
+        for key in keys:
+            self.assertIn(key, S)
+
+    def test_priority_queue(self):
+        state = {'version': 0, 'offset': {}}
+
+        def priority(point):
+            return point[0] + state['offset'].get(point[0], 0.)
+
+        Q = PrioritySearchQueue(lambda labels: labels.sum(), priority,
+                                lambda: state['version'], max_bytes=0)
+        for x in [3., 1., 2., 1.]:
+            Q.append((x, 0., np.array([int(x)]), np.zeros(4)))
+
+        # ties are popped last in, first out, joints are rebuilt
+        point = Q.pop()
+        self.assertEqual(point[0], 1.)
+        self.assertEqual(point[3], 1)
+        self.assertEqual(Q.top(1)[0][0], 1.)
+        self.assertEqual(Q.pop()[0], 1.)
+
+        # stale priorities are refreshed when popped
+        state['version'], state['offset'] = 1, {2.: 5.}
+        self.assertEqual(Q.pop()[0], 3.)
+        self.assertEqual(Q.pop()[0], 2.)
+        self.assertEqual(len(Q), 0)
+        self.assertEqual(Q.nbytes, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import scipy.sparse as sp
+
+from pareto_dib import (load_sweep, pareto_mapper, pareto_sweep,
+                        symmetric_pareto_mapper)
+
+
+class SweepUtilTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+
+        self.pxy = rng.random((7, 4))
+        self.pxy /= self.pxy.sum()
+
+        # Z = X1 + X2 mod 5 with uniform X1, X2
+        self.pxxy = np.zeros((5, 5, 5))
+        for x1 in range(5):
+            for x2 in range(5):
+                self.pxxy[x1, x2, (x1 + x2) % 5] = 1 / 25
+
+    def test_sweep(self):
+        joints = {'random': self.pxy, 'cyclic': self.pxxy}
+        epsilons = [1e-8, 1e-2]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = os.path.join(tmp, 'sweep.jsonl')
+            records = pareto_sweep(joints, epsilons, store=store, seed=0)
+
+            # cached runs of a joint and runs in a pool find the same
+            # frontiers as separate runs
+            for kwargs in [{'cache_size': None, 'workers': 2}, {}]:
+                runs = pareto_sweep(joints, epsilons, seed=0, **kwargs)
+                self.assertCountEqual(
+                    [(r['dataset'], r['epsilon']) for r in runs],
+                    [(r['dataset'], r['epsilon']) for r in records])
+
+            stored = load_sweep(store)
+
+        self.assertEqual(len(records), 4)
+        self.assertEqual(len(stored), 4)
+
+        for record, loaded in zip(records, stored):
+            if record['dataset'] == 'random':
+                pset, run_stats = pareto_mapper(
+                    self.pxy, epsilon=record['epsilon'], seed=0)
+                self.assertIsNotNone(record['run_stats']['cache_hit_rate'])
+            else:
+                pset, run_stats = symmetric_pareto_mapper(
+                    self.pxxy, epsilon=record['epsilon'], seed=0)
+
+            np.testing.assert_array_almost_equal(record['frontier'],
+                                                 pset.to_array())
+            np.testing.assert_array_almost_equal(loaded['frontier'],
+                                                 pset.to_array())
+            for labels, point in zip(loaded['labels'], pset):
+                np.testing.assert_array_equal(labels, point[2])
+
+            self.assertEqual(loaded['run_stats']['searched'],
+                             run_stats['searched'])
+
+        # the deeper search of a joint runs first and warms the cache
+        random = [r for r in records if r['dataset'] == 'random']
+        self.assertEqual([r['epsilon'] for r in random], [1e-2, 1e-8])
+
+        _, run_stats = pareto_mapper(self.pxy, seed=0, cache_size=100000)
+        self.assertGreater(random[1]['run_stats']['cache_hit_rate'],
+                           run_stats['cache_hit_rate'])
+
+    def test_sweep_mappers(self):
+        # a sparse (N N, |Y|) joint may be p_{X1 X2; Y}
+        joints = {'cyclic': sp.csr_matrix(self.pxxy.reshape(25, 5))}
+        with self.assertRaises(ValueError):
+            pareto_sweep(joints, [1e-8], seed=0)
+
+        pset, _ = symmetric_pareto_mapper(joints['cyclic'], seed=0)
+        for workers in [None, 2]:
+            records = pareto_sweep(joints, [1e-8], seed=0, workers=workers,
+                                   mappers={'cyclic': 'symmetric'})
+            np.testing.assert_array_almost_equal(records[0]['frontier'],
+                                                 pset.to_array())
+
+        # the epsilons of a single dataset are separate tasks of the pool
+        records = pareto_sweep({'random': self.pxy}, [1e-8, 1e-2], seed=0,
+                               workers=2)
+        self.assertCountEqual([r['epsilon'] for r in records], [1e-8, 1e-2])
+        for record in records:
+            pset, _ = pareto_mapper(self.pxy, epsilon=record['epsilon'],
+                                    seed=0)
+            np.testing.assert_array_almost_equal(record['frontier'],
+                                                 pset.to_array())
+            self.assertIsNotNone(record['run_stats']['cache_hit_rate'])
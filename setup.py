@@ -19,8 +19,8 @@ setup(
     install_requires=['matplotlib',
                       'numpy',
                       'scipy',
-                      'sortedcontainers',
                       ],
+    extras_require={'numba': ['numba']},
     package_dir={'pareto_dib': 'pareto_dib'},
     test_suite="pareto_dib.test",
 )